@@ -5,3 +5,7 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = 'АПИ'
+
+    def ready(self):
+        from . import (  # noqa: F401
+            conditional, images, ingredient_index, recipe_cache, tag_index)
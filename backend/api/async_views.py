@@ -0,0 +1,246 @@
+"""Асинхронные версии самых частых запросов для запуска под ASGI.
+
+Подключаются в api/urls.py при ASYNC_VIEWS=True поверх тех же адресов,
+что и RecipeViewSet/IngredientViewSet. Методы и параметры, которые здесь
+не поддержаны, передаются синхронным представлениям без изменений.
+"""
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.urls import path
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from .conditional import (aconditional_response, catalog_validators,
+                          recipes_etag)
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .pagination import MyPageNumberPaginator
+from .recipe_lists import add_recipes, remove_recipes
+from .serializer import (IngredientSerializer, RecipeSerializer,
+                         SubRecipeSerializer)
+from .views import IngredientViewSet, RecipeViewSet
+
+# Параметры списка рецептов, которые обрабатывает только RecipeViewSet.
+SYNC_ONLY_PARAMS = ('cursor', 'ordering')
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status,
+                        content_type='application/json')
+
+
+async def authenticate(request):
+    """Пользователь по заголовку «Authorization: Token <ключ>».
+
+    Повторяет TokenAuthentication: без заголовка — аноним,
+    с неверным ключом — None.
+    """
+    header = request.headers.get('Authorization', '').split()
+    if not header or header[0].lower() != 'token':
+        return AnonymousUser()
+    if len(header) != 2:
+        return None
+    token = await Token.objects.select_related('user').filter(
+        key=header[1]).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def hybrid_view(sync_view, **handlers):
+    """Представление, отдающее методы из handlers корутинам.
+
+    Остальные методы, а также запросы, на которые корутина вернула None,
+    обрабатывает sync_view.
+    """
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        handler = handlers.get(request.method.lower())
+        if handler is not None:
+            user = await authenticate(request)
+            if user is None:
+                response = json_response(
+                    {'detail': 'Недопустимый токен.'}, status=401)
+                response['WWW-Authenticate'] = 'Token'
+                return response
+            request.user = user
+            response = await handler(request, *args, **kwargs)
+            if response is not None:
+                return response
+        return await sync_view(request, *args, **kwargs)
+
+    # csrf_exempt в Django 4.2 оборачивает только синхронные функции.
+    view.csrf_exempt = True
+    return view
+
+
+def serializer_context(request):
+    return {'request': request, 'format': None, 'view': None}
+
+
+async def render_recipes(request, recipes, many=True):
+    def render():
+        return RecipeSerializer(
+            recipes, many=many, context=serializer_context(request)).data
+    return await sync_to_async(render)()
+
+
+def recipes_queryset(request):
+    return Recipe.objects.with_user_flags(request.user).defer(
+        'search_vector')
+
+
+async def recipe_list(request):
+    if any(param in request.GET for param in SYNC_ONLY_PARAMS):
+        return None
+    filterset = RecipeFilter(
+        request.GET, queryset=recipes_queryset(request), request=request)
+    # Проверка автора и тегов может читать базу синхронным ORM.
+    if not await sync_to_async(filterset.is_valid)():
+        return json_response(filterset.errors, status=400)
+    queryset = filterset.qs
+    paginator = MyPageNumberPaginator
+    try:
+        page = int(request.GET.get(paginator.page_query_param, 1))
+        limit = int(request.GET.get(
+            paginator.page_size_query_param, paginator.page_size))
+    except ValueError:
+        return None
+    if limit < 1:
+        limit = paginator.page_size
+    count = await queryset.acount()
+    pages = max(ceil(count / limit), 1)
+    if not 1 <= page <= pages:
+        return json_response({'detail': 'Неправильная страница'}, status=404)
+    recipes = [recipe async for recipe
+               in queryset[(page - 1) * limit:page * limit]]
+
+    async def render():
+        url = request.build_absolute_uri()
+        previous_url = None
+        if page > 1:
+            previous_url = (
+                replace_query_param(url, paginator.page_query_param,
+                                    page - 1)
+                if page > 2
+                else remove_query_param(url, paginator.page_query_param))
+        return json_response({
+            'count': count,
+            'next': (replace_query_param(
+                url, paginator.page_query_param, page + 1)
+                if page < pages else None),
+            'previous': previous_url,
+            'results': await render_recipes(request, recipes),
+        })
+
+    return await aconditional_response(
+        request, recipes_etag(request, recipes, count), None, render,
+        personalised=True)
+
+
+async def recipe_detail(request, pk):
+    recipe = await recipes_queryset(request).filter(pk=pk).afirst()
+    if recipe is None:
+        return json_response(
+            {'detail': 'Страница не найдена.'}, status=404)
+
+    async def render():
+        return json_response(
+            await render_recipes(request, recipe, many=False))
+
+    return await aconditional_response(
+        request, recipes_etag(request, [recipe]), None, render,
+        personalised=True)
+
+
+def toggle(model):
+    """Добавление в избранное или корзину и удаление оттуда.
+
+    Пишут синхронные add_recipes/remove_recipes: строка списка, счётчик
+    рецепта и итоги корзины меняются в одной транзакции. Дубликат
+    отсекается ON CONFLICT, а не предварительным запросом; удаление
+    ограничено строками текущего пользователя.
+    """
+    async def handler(request, pk):
+        user = request.user
+        if not user.is_authenticated:
+            response = json_response({
+                'detail': 'Учетные данные не были предоставлены.'
+            }, status=401)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        if request.method == 'DELETE':
+            if not await sync_to_async(remove_recipes)(model, user, [pk]):
+                return json_response(
+                    {'errors': 'Объект не найден'}, status=404)
+            return HttpResponse(status=204)
+        recipe = await Recipe.objects.filter(pk=pk).afirst()
+        if recipe is None:
+            return json_response(
+                {'detail': 'Страница не найдена.'}, status=404)
+        if not await sync_to_async(add_recipes)(model, user, [recipe.pk]):
+            return json_response(
+                {'errors': 'Рецепт уже добавлен!'}, status=400)
+        return json_response(SubRecipeSerializer(
+            recipe, context=serializer_context(request)).data, status=201)
+
+    return handler
+
+
+async def ingredient_list(request):
+    name = request.GET.get('name')
+    if name is None:
+        return None
+    fuzzy = request.GET.get('fuzzy', '').lower() in ('1', 'true')
+    etag, last_modified = catalog_validators()
+
+    async def render():
+        ingredients = await ingredient_index.alookup(name, fuzzy)
+        return json_response(
+            IngredientSerializer(ingredients, many=True).data)
+
+    return await aconditional_response(request, etag, last_modified, render)
+
+
+favorite = toggle(Favorite)
+shopping_cart = toggle(ShoppingCart)
+
+urlpatterns = [
+    path('recipes/', hybrid_view(
+        RecipeViewSet.as_view(
+            {'get': 'list', 'post': 'create'}, basename='recipe',
+            detail=False),
+        get=recipe_list,
+    )),
+    path('recipes/<int:pk>/', hybrid_view(
+        RecipeViewSet.as_view(
+            {'get': 'retrieve', 'put': 'update',
+             'patch': 'partial_update', 'delete': 'destroy'},
+            basename='recipe', detail=True),
+        get=recipe_detail,
+    )),
+    path('recipes/<int:pk>/favorite/', hybrid_view(
+        RecipeViewSet.as_view(
+            {'post': 'favorite_change', 'delete': 'favorite_change'},
+            basename='recipe', detail=True),
+        post=favorite, delete=favorite,
+    )),
+    path('recipes/<int:pk>/shopping_cart/', hybrid_view(
+        RecipeViewSet.as_view(
+            {'post': 'shopping_carg_change',
+             'delete': 'shopping_carg_change'},
+            basename='recipe', detail=True),
+        post=shopping_cart, delete=shopping_cart,
+    )),
+    path('ingredients/', hybrid_view(
+        IngredientViewSet.as_view({'get': 'list'}, basename='ingredient',
+                                  detail=False),
+        get=ingredient_list,
+    )),
+]
@@ -0,0 +1,124 @@
+import hashlib
+from functools import partial
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import MyUser, Subscription
+from .shared_cache import bump_versions, get_version
+
+CATALOG_VERSION_KEY = 'catalog-version'
+USER_VERSION_KEY = 'user-version'
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False)
+    return f'"{digest.hexdigest()}"'
+
+
+def set_validators(response, etag, last_modified, personalised):
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if personalised:
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+    return response
+
+
+def conditional_response(request, etag, last_modified, render,
+                         personalised=False):
+    """304 при совпадении валидаторов, иначе ответ render().
+
+    ETag и Last-Modified ставятся в обоих случаях; last_modified — время
+    в секундах или None.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+    return set_validators(response, etag, last_modified, personalised)
+
+
+async def aconditional_response(request, etag, last_modified, render,
+                                personalised=False):
+    """То же, что conditional_response, для корутины render."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await render()
+    return set_validators(response, etag, last_modified, personalised)
+
+
+def catalog_validators():
+    """ETag и Last-Modified тегов и ингредиентов: общая версия каталога."""
+    version = get_version(CATALOG_VERSION_KEY)
+    return make_etag(CATALOG_VERSION_KEY, version), version // 10 ** 9
+
+
+def catalog_response(request, render):
+    return conditional_response(request, *catalog_validators(), render)
+
+
+class CatalogConditionalMixin:
+    """Условные GET для справочников, которые меняет только админка."""
+
+    def list(self, request, *args, **kwargs):
+        return catalog_response(
+            request, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return catalog_response(
+            request, partial(super().retrieve, request, *args, **kwargs))
+
+
+def recipes_etag(request, recipes, *parts):
+    """ETag выдачи рецептов без её сериализации.
+
+    Общая часть ответа зависит от updated_at рецепта, его счётчиков,
+    версии каталога и хоста в ссылках на картинки, личная — от флагов
+    избранного и корзины и от версии подписок пользователя.
+    """
+    user = request.user
+    user_version = None
+    if user.is_authenticated:
+        user_version = get_version(f'{USER_VERSION_KEY}:{user.pk}')
+    return make_etag(
+        request.build_absolute_uri('/'),
+        get_version(CATALOG_VERSION_KEY),
+        user.pk,
+        user_version,
+        *parts,
+        [(recipe.pk, recipe.updated_at, recipe.favorites_count,
+          recipe.shopping_cart_count,
+          getattr(recipe, 'is_favorited', None),
+          getattr(recipe, 'is_in_shopping_cart', None))
+         for recipe in recipes],
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_catalog_version(**kwargs):
+    # После коммита: список, собранный до него, не получит новый ETag.
+    bump_versions([CATALOG_VERSION_KEY])
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_user_version(instance, **kwargs):
+    bump_versions([f'{USER_VERSION_KEY}:{instance.subscriber_id}'])
+
+
+@receiver(post_save, sender=MyUser)
+def touch_author_recipes(instance, created, update_fields, **kwargs):
+    """Имя и аватар автора входят в представление его рецептов."""
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
@@ -1,20 +1,28 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipe, Tag
-from rest_framework.filters import SearchFilter
+from recipes.models import Recipe
+from recipes.search import search_recipes
+from rest_framework.filters import OrderingFilter
 from users.models import MyUser
+from .tag_index import tag_choices, tag_index
 
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка по хранимым счётчикам с -id для однозначного порядка."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and ordering[-1].lstrip('-') != 'id':
+            ordering = [*ordering, '-id']
+        return ordering
 
 
 class RecipeFilter(FilterSet):
     author = filters.ModelChoiceFilter(
         queryset=MyUser.objects.all())
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags',
     )
     is_in_shopping_cart = filters.CharFilter(
         method='filter_is_in_shopping_cart'
@@ -22,10 +30,23 @@ class RecipeFilter(FilterSet):
     is_favorited = filters.CharFilter(
         method='filter_is_favorited'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
+
+    def filter_tags(self, queryset, name, value):
+        """EXISTS вместо JOIN: рецепт попадает в выдачу один раз."""
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=tag_index.ids(value),
+            )
+        ))
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -36,3 +57,6 @@ class RecipeFilter(FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return False
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,192 @@
+import binascii
+import logging
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import Recipe
+from users.models import MyUser
+from . import recipe_cache
+
+logger = logging.getLogger(__name__)
+
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо.
+DECODE_CHUNK_SIZE = 64 * 1024
+RENDITIONS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+LAST_RENDITION = (list(RENDITIONS)[-1], list(FORMATS)[-1])
+
+
+def close_quietly(file):
+    try:
+        file.close()
+    except FileNotFoundError:
+        pass
+
+
+def decode_base64_image(data, name, content_type):
+    """Декодирует base64 кусками во временный файл на диске.
+
+    Размер результата ограничен IMAGE_MAX_UPLOAD_SIZE; Pillow затем
+    открывает файл по пути, не копируя его содержимое в память.
+    """
+    # Переносы строк (base64 MIME) сдвинули бы границы кусков,
+    # и куски перестали бы быть кратны 4.
+    data = ''.join(data.split())
+    max_size = settings.IMAGE_MAX_UPLOAD_SIZE
+    if len(data) // 4 * 3 > max_size:
+        raise ValidationError(
+            f'Размер изображения превышает {max_size} байт.')
+    upload = TemporaryUploadedFile(name, content_type, 0, None)
+    # Хранилище переносит временный файл на место, а не копирует его,
+    # поэтому при сборке мусора удалять уже нечего.
+    weakref.finalize(upload, close_quietly, upload.file)
+    try:
+        for start in range(0, len(data), DECODE_CHUNK_SIZE):
+            upload.write(binascii.a2b_base64(
+                data[start:start + DECODE_CHUNK_SIZE]))
+    except binascii.Error:
+        upload.close()
+        raise ValidationError('Некорректная кодировка изображения.')
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
+
+
+def get_rendition_name(name, rendition, file_format):
+    stem, _ = os.path.splitext(name)
+    return f'renditions/{stem}/{rendition}.{file_format}'
+
+
+def renditions_ready(name):
+    """Созданы ли копии: make_renditions() пишет этот файл последним."""
+    return default_storage.exists(
+        get_rendition_name(name, *LAST_RENDITION))
+
+
+def get_rendition_urls(image, request=None):
+    """Адреса всех вариантов изображения: {вариант: {формат: url}}.
+
+    None, пока копии не созданы или если создать их не удалось:
+    клиенту остаётся исходное изображение.
+    """
+    if not image or not renditions_ready(image.name):
+        return None
+    urls = {}
+    for rendition in RENDITIONS:
+        urls[rendition] = {}
+        for file_format in FORMATS:
+            url = default_storage.url(
+                get_rendition_name(image.name, rendition, file_format))
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[rendition][file_format] = url
+    return urls
+
+
+def make_renditions(name):
+    """Создаёт уменьшенные копии изображения name во всех форматах."""
+    with default_storage.open(name) as file:
+        original = Image.open(file)
+        original.load()
+    for rendition, size in RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail((size, size))
+        for file_format, (pil_format, options) in FORMATS.items():
+            converted = image
+            if pil_format == 'JPEG' and image.mode != 'RGB':
+                converted = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                converted = image.convert('RGBA')
+            buffer = BytesIO()
+            converted.save(buffer, pil_format, **options)
+            rendition_name = get_rendition_name(name, rendition, file_format)
+            default_storage.delete(rendition_name)
+            default_storage.save(
+                rendition_name, ContentFile(buffer.getvalue()))
+
+
+def touch_recipes(recipes):
+    """Сбрасывает ETag и кеш рецептов: в них появились копии."""
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now())
+    recipe_cache.invalidate(recipe_ids)
+
+
+def run_make_renditions(name, recipes):
+    try:
+        make_renditions(name)
+        touch_recipes(recipes)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', name)
+
+
+def run_in_worker(name, recipes):
+    try:
+        run_make_renditions(name, recipes)
+    finally:
+        # Соединения потоков пула не закрывает обработчик запросов.
+        connections.close_all()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_RENDITION_WORKERS,
+        thread_name_prefix='renditions',
+    )
+
+
+def schedule_renditions(name, recipes):
+    """Ставит создание копий в пул потоков после фиксации транзакции.
+
+    Когда копии готовы, рецепты recipes (QuerySet) получают новый
+    updated_at. При IMAGE_RENDITION_WORKERS = 0 копии создаются сразу
+    после коммита в том же потоке.
+    """
+    if settings.IMAGE_RENDITION_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_worker, name, recipes))
+    else:
+        transaction.on_commit(lambda: run_make_renditions(name, recipes))
+
+
+def schedule_missing_renditions(image, recipes):
+    if image and not renditions_ready(image.name):
+        schedule_renditions(image.name, recipes)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_renditions(instance, **kwargs):
+    schedule_missing_renditions(
+        instance.image, Recipe.objects.filter(image=instance.image.name))
+
+
+@receiver(post_save, sender=MyUser)
+def avatar_renditions(instance, update_fields, **kwargs):
+    if update_fields and 'avatar' not in update_fields:
+        return
+    # Аватар автора входит в представление его рецептов.
+    schedule_missing_renditions(
+        instance.avatar, Recipe.objects.filter(author=instance.pk))
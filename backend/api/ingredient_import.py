@@ -0,0 +1,224 @@
+"""Загрузка каталога ингредиентов из CSV и JSON.
+
+Строки читаются потоком и записываются пачками: совпадение ищется по
+нормализованной паре (название, единица) без учёта регистра. Новые
+пары добавляются, у найденных обновляется написание, точные повторы
+пропускаются.
+"""
+import csv
+import io
+import itertools
+import json
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from recipes.models import MAX_CHARFIELD_LENGHT, Ingredient
+from . import recipe_cache
+from .conditional import CATALOG_VERSION_KEY
+from .ingredient_index import ingredient_index
+from .shared_cache import bump_versions
+
+BATCH_SIZE = 5000
+READ_CHUNK_SIZE = 64 * 1024
+CSV_HEADER = ['name', 'measurement_unit']
+# Символы между объектами JSON-массива и строками JSON Lines.
+JSON_SEPARATORS = ' \t\r\n[],'
+
+
+class ImportResult:
+    """Итоги загрузки: сколько пар добавлено, обновлено, пропущено."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.invalid = 0
+
+    @property
+    def total(self):
+        return self.inserted + self.updated + self.skipped + self.invalid
+
+
+def normalise(value):
+    return ' '.join(value.split())
+
+
+def read_csv(file):
+    """Строки CSV «название,единица»; заголовок пропускается."""
+    rows = csv.reader(file)
+    for row in rows:
+        if row != CSV_HEADER:
+            yield row
+        break
+    yield from rows
+
+
+def read_json(file):
+    """Объекты JSON-массива или JSON Lines по одному, без чтения
+    всего файла в память."""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position < len(buffer):
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if eof:
+                    raise ValueError(f'Некорректный JSON: {error}')
+            else:
+                yield item
+                continue
+        elif eof:
+            return
+        # Объект оборвался на границе куска или буфер кончился.
+        chunk = file.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def clean(row):
+    """Нормализованная пара (название, единица) или None, если строка
+    некорректна."""
+    if isinstance(row, dict):
+        row = (row.get('name'), row.get('measurement_unit'))
+    if (not isinstance(row, (list, tuple)) or len(row) != 2
+            or not all(isinstance(value, str) for value in row)):
+        return None
+    name, unit = map(normalise, row)
+    if not (0 < len(name) <= MAX_CHARFIELD_LENGHT
+            and 0 < len(unit) <= MAX_CHARFIELD_LENGHT):
+        return None
+    return name, unit
+
+
+def upsert_copy(pairs):
+    """Пачка через COPY во временную таблицу; только PostgreSQL.
+
+    Возвращает (добавлено, обновлено).
+    """
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    buffer = io.StringIO()
+    for name, unit in pairs:
+        # После normalise в значениях нет табуляций и переводов строк.
+        buffer.write(f'{name}\t{unit}\n'.replace('\\', '\\\\'))
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE ingredient_import (name text, unit text) '
+            'ON COMMIT DROP')
+        cursor.copy_expert(
+            'COPY ingredient_import (name, unit) FROM STDIN', buffer)
+        # Без статистики планировщик может выбрать полный проход по
+        # каталогу вместо индекса ingredient_name_unit_idx.
+        cursor.execute('ANALYZE ingredient_import')
+        cursor.execute(
+            f'WITH updated AS ('
+            f'UPDATE {table} i SET name = s.name, measurement_unit = s.unit '
+            f'FROM ingredient_import s '
+            f'WHERE lower(i.name) = lower(s.name) '
+            f'AND lower(i.measurement_unit) = lower(s.unit) '
+            f'AND (i.name <> s.name OR i.measurement_unit <> s.unit) '
+            f'RETURNING s.name, s.unit) '
+            f'SELECT count(DISTINCT (name, unit)) FROM updated')
+        updated = cursor.fetchone()[0]
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'SELECT s.name, s.unit FROM ingredient_import s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {table} i '
+            f'WHERE lower(i.name) = lower(s.name) '
+            f'AND lower(i.measurement_unit) = lower(s.unit))')
+        inserted = cursor.rowcount
+        # ON COMMIT DROP не сработает, если загрузка идёт внутри внешней
+        # транзакции, а следующей пачке нужна пустая таблица.
+        cursor.execute('DROP TABLE ingredient_import')
+        return inserted, updated
+
+
+def find_ingredients(pairs):
+    """Ингредиенты каталога, совпадающие с парами без учёта регистра.
+
+    Возвращает {(название, единица) в нижнем регистре: [Ingredient]}.
+    Lower() в SQLite понижает только латиницу, поэтому кириллица там
+    совпадает без учёта регистра, только если написание не менялось.
+    """
+    keys = {(name.lower(), unit.lower()) for name, unit in pairs}
+    found = defaultdict(list)
+    for ingredient in Ingredient.objects.annotate(
+            key_name=Lower('name')).filter(
+            Q(name__in={name for name, _ in pairs})
+            | Q(key_name__in={name for name, _ in keys})).only(
+            'name', 'measurement_unit'):
+        key = (ingredient.name.lower(), ingredient.measurement_unit.lower())
+        if key in keys:
+            found[key].append(ingredient)
+    return found
+
+
+def upsert_orm(pairs):
+    """Пачка через ORM для остальных баз."""
+    keys = {(name.lower(), unit.lower()): (name, unit)
+            for name, unit in pairs}
+    existing = find_ingredients(pairs)
+    changed = []
+    updated = 0
+    for key, ingredients in existing.items():
+        name, unit = keys[key]
+        stale = [ingredient for ingredient in ingredients
+                 if (ingredient.name, ingredient.measurement_unit)
+                 != (name, unit)]
+        for ingredient in stale:
+            ingredient.name, ingredient.measurement_unit = name, unit
+        changed.extend(stale)
+        updated += bool(stale)
+    Ingredient.objects.bulk_update(changed, ['name', 'measurement_unit'])
+    created = Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit=unit)
+        for key, (name, unit) in keys.items() if key not in existing)
+    return len(created), updated
+
+
+def import_ingredients(rows, batch_size=BATCH_SIZE, on_batch=None):
+    """Загружает строки rows пачками по batch_size.
+
+    Каждая пачка пишется в своей транзакции; on_batch(result) вызывается
+    после каждой. Кеши каталога сбрасываются после фиксации.
+    """
+    upsert = (upsert_copy if connection.vendor == 'postgresql'
+              else upsert_orm)
+    result = ImportResult()
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        unique = {}
+        for row in batch:
+            pair = clean(row)
+            if pair is None:
+                result.invalid += 1
+                continue
+            key = (pair[0].lower(), pair[1].lower())
+            if key in unique:
+                result.skipped += 1
+            else:
+                unique[key] = pair
+        with transaction.atomic():
+            inserted, updated = upsert(list(unique.values()))
+        result.inserted += inserted
+        result.updated += updated
+        result.skipped += len(unique) - inserted - updated
+        if on_batch is not None:
+            on_batch(result)
+    if result.inserted or result.updated:
+        transaction.on_commit(lambda: invalidate_catalog(result.updated))
+    return result
+
+
+def invalidate_catalog(updated):
+    ingredient_index.invalidate()
+    bump_versions([CATALOG_VERSION_KEY])
+    if updated:
+        # Переименование видно в составе уже закешированных рецептов.
+        recipe_cache.invalidate(None)
@@ -0,0 +1,164 @@
+import bisect
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient
+from .shared_cache import aget_version, bump_versions, get_version
+
+VERSION_CACHE_KEY = 'ingredient-index-version'
+
+
+def fold(value):
+    """Приводит строку к виду для сравнения без учёта регистра и ё/е."""
+    return value.strip().casefold().replace('ё', 'е')
+
+
+def trigrams(value):
+    """Триграммы строки по правилам pg_trgm.
+
+    Каждое слово дополняется двумя пробелами слева и одним справа,
+    поэтому перестановка слов почти не меняет набор триграмм.
+    """
+    result = set()
+    for word in re.findall(r'\w+', fold(value)):
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+def similarity(left, right):
+    """Доля общих триграмм, как similarity() в pg_trgm."""
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Загружается при первом обращении и перечитывается, когда меняется
+    версия в кеше Django: сигналы на изменение Ingredient обновляют её
+    после коммита.
+    Индексы всех воркеров сбрасываются только при общем кеше из
+    настройки CACHES (см. api.shared_cache); с LocMem остальные
+    процессы увидят изменения лишь после перезапуска.
+    Нечёткий поиск на PostgreSQL идёт через GIN-индекс pg_trgm,
+    на остальных СУБД — по триграммам, посчитанным при загрузке.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._items = []
+        self._trigrams = []
+
+    def _load(self, ingredients):
+        items = sorted(
+            ((fold(item.name), item) for item in ingredients),
+            key=lambda pair: (pair[0], pair[1].pk)
+        )
+        self._keys = [key for key, _ in items]
+        self._items = [item for _, item in items]
+        self._trigrams = [trigrams(key) for key in self._keys]
+
+    def _ensure_loaded(self):
+        version = get_version(VERSION_CACHE_KEY)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._load(Ingredient.objects.all().iterator())
+                self._version = version
+
+    async def _aensure_loaded(self):
+        version = await aget_version(VERSION_CACHE_KEY)
+        if version == self._version:
+            return
+        ingredients = [item async for item in Ingredient.objects.all()]
+        with self._lock:
+            self._load(ingredients)
+            self._version = version
+
+    def search(self, prefix):
+        """Ингредиенты, название которых начинается с prefix."""
+        self._ensure_loaded()
+        return self._search_loaded(prefix)
+
+    def _search_loaded(self, prefix):
+        keys, items = self._keys, self._items
+        prefix = fold(prefix)
+        start = bisect.bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return items[start:end]
+
+    def similar(self, name, threshold, limit, exclude=()):
+        """До limit ингредиентов, похожих на name, по убыванию сходства."""
+        if connection.vendor == 'postgresql':
+            # Порог задаётся только на время транзакции, чтобы не менять
+            # состояние сессии, общей за PgBouncer.
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('pg_trgm.similarity_threshold', "
+                    '%s, true)', [str(threshold)])
+                return list(
+                    Ingredient.objects
+                    .filter(name__trigram_similar=name)
+                    .exclude(pk__in=exclude)
+                    .annotate(similarity=TrigramSimilarity('name', name))
+                    .order_by('-similarity', 'name')[:limit]
+                )
+        self._ensure_loaded()
+        query = trigrams(name)
+        ranked = []
+        for key, item, item_trigrams in zip(
+                self._keys, self._items, self._trigrams):
+            score = similarity(query, item_trigrams)
+            if score >= threshold and item.pk not in exclude:
+                ranked.append((-score, key, item))
+        ranked.sort(key=lambda entry: entry[:2])
+        return [item for _, _, item in ranked[:limit]]
+
+    def lookup(self, name, fuzzy=False):
+        """Сначала совпадения по префиксу, затем в режиме fuzzy — похожие.
+
+        В нечётком режиме выдача ограничена INGREDIENT_FUZZY_LIMIT.
+        """
+        found = self.search(name)
+        if not fuzzy:
+            return found
+        limit = settings.INGREDIENT_FUZZY_LIMIT
+        found = found[:limit]
+        if len(found) < limit:
+            found += self.similar(
+                name, settings.INGREDIENT_FUZZY_THRESHOLD,
+                limit - len(found), {item.pk for item in found})
+        return found
+
+    async def alookup(self, name, fuzzy=False):
+        """lookup() для асинхронных представлений."""
+        await self._aensure_loaded()
+        if fuzzy:
+            return await sync_to_async(self.lookup)(name, fuzzy)
+        return self._search_loaded(name)
+
+    def invalidate(self):
+        bump_versions([VERSION_CACHE_KEY])
+
+
+ingredient_index = IngredientIndex()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
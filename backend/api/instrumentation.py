@@ -0,0 +1,201 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from rest_framework.serializers import BaseSerializer
+
+# Границы корзин гистограммы длительности запросов, в секундах.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Замеры одного запроса: база, сериализация, повторы запросов."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self._seen = set()
+        self.duplicates = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        key = (sql, repr(params))
+        if key in self._seen:
+            self.duplicates += 1
+        else:
+            self._seen.add(key)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{self.queries} queries"',
+            f'dup;desc="{self.duplicates} duplicate queries"',
+            f'ser;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+class RouteMetrics:
+    """Счётчики и гистограмма длительности одного маршрута."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.duplicates = 0
+        self.serializer_time = 0.0
+        self.statuses = defaultdict(int)
+
+
+class Metrics:
+    """Метрики маршрутов, накопленные в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteMetrics)
+
+    def observe(self, view, method, status, duration, stats):
+        with self._lock:
+            route = self._routes[(view, method)]
+            route.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+            route.duration += duration
+            route.statuses[status] += 1
+            route.queries += stats.queries
+            route.db_time += stats.db_time
+            route.duplicates += stats.duplicates
+            route.serializer_time += stats.serializer_time
+
+    def exposition(self):
+        """Метрики в текстовом формате Prometheus 0.0.4."""
+        pid = os.getpid()
+        lines = [
+            '# HELP foodgram_http_requests_total Обработанные запросы.',
+            '# TYPE foodgram_http_requests_total counter',
+        ]
+        with self._lock:
+            routes = sorted(self._routes.items())
+            for (view, method), route in routes:
+                for status, count in sorted(route.statuses.items()):
+                    lines.append(
+                        'foodgram_http_requests_total{'
+                        f'{labels(pid, view, method)},status="{status}"'
+                        f'}} {count}')
+            lines += [
+                '# HELP foodgram_http_request_duration_seconds '
+                'Длительность запросов.',
+                '# TYPE foodgram_http_request_duration_seconds histogram',
+            ]
+            for (view, method), route in routes:
+                route_labels = labels(pid, view, method)
+                cumulative = 0
+                for bound, count in zip(
+                        (*BUCKETS, '+Inf'), route.buckets):
+                    cumulative += count
+                    lines.append(
+                        'foodgram_http_request_duration_seconds_bucket{'
+                        f'{route_labels},le="{bound}"}} {cumulative}')
+                lines += [
+                    'foodgram_http_request_duration_seconds_sum'
+                    f'{{{route_labels}}} {route.duration:.6f}',
+                    'foodgram_http_request_duration_seconds_count'
+                    f'{{{route_labels}}} {cumulative}',
+                ]
+            for name, help_text, attribute in COUNTERS:
+                lines += [f'# HELP {name} {help_text}',
+                          f'# TYPE {name} counter']
+                for (view, method), route in routes:
+                    lines.append(
+                        f'{name}{{{labels(pid, view, method)}}} '
+                        f'{getattr(route, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+
+COUNTERS = (
+    ('foodgram_db_queries_total', 'Запросы к базе.', 'queries'),
+    ('foodgram_db_duration_seconds_total', 'Время в базе.', 'db_time'),
+    ('foodgram_db_duplicate_queries_total',
+     'Повторы одного запроса с теми же параметрами.', 'duplicates'),
+    ('foodgram_serializer_duration_seconds_total',
+     'Время сериализации ответов.', 'serializer_time'),
+)
+
+
+def labels(pid, view, method):
+    return f'pid="{pid}",view="{view}",method="{method}"'
+
+
+metrics = Metrics()
+
+
+def instrument_serializers():
+    """Учитывает время BaseSerializer.data в замерах текущего запроса.
+
+    Вложенные вызовы .data не суммируются повторно.
+    """
+    original = BaseSerializer.data
+    if getattr(original.fget, 'instrumented', False):
+        return
+
+    def data(self):
+        stats = current_stats.get()
+        if stats is None or stats.serializer_depth:
+            return original.fget(self)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            stats.serializer_depth -= 1
+            stats.serializer_time += time.perf_counter() - started
+
+    data.instrumented = True
+    BaseSerializer.data = property(data)
+
+
+class InstrumentationMiddleware:
+    """Замеры запросов: заголовок Server-Timing и метрики маршрутов.
+
+    Включается настройкой INSTRUMENTATION; выключенное middleware
+    убирается из цепочки и ничего не стоит. Время базы считается только
+    для запросов из потока обработчика, поэтому у асинхронных
+    представлений оно неполное.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        instrument_serializers()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        metrics.observe(
+            match.view_name if match else 'unmatched',
+            request.method, response.status_code, duration, stats)
+        response['Server-Timing'] = stats.server_timing(duration)
+        return response
@@ -0,0 +1,83 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, share):
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def run_concurrently(task, count, concurrency, warmup=0):
+    """Выполняет task(номер) count раз в concurrency потоков.
+
+    Возвращает результаты и время замера без учёта прогрева.
+    """
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(task, range(warmup)))
+        started = time.perf_counter()
+        results = list(executor.map(task, range(count)))
+        return results, time.perf_counter() - started
+
+
+def describe_latencies(latencies):
+    """Перцентили задержки в миллисекундах; latencies отсортированы."""
+    return (f'p50 {statistics.median(latencies) * 1000:.1f}, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.1f}, '
+            f'p99 {percentile(latencies, 0.99) * 1000:.1f}, '
+            f'max {latencies[-1] * 1000:.1f}')
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер и выводит пропускную способность '
+            'и перцентили задержки. Для сравнения WSGI и ASGI запустите '
+            'его против обоих развёртываний с одинаковым лимитом памяти.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+',
+                            help='Адреса, запрашиваемые по кругу.')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--token', help='Токен для заголовка '
+                                            'Authorization.')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Запросы перед замером, не учитываются.')
+
+    def handle(self, *args, **options):
+        urls = options['urls']
+        method = options['method'].upper()
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        local = threading.local()
+
+        def send(number):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+                local.session.headers.update(headers)
+            started = time.perf_counter()
+            try:
+                response = local.session.request(
+                    method, urls[number % len(urls)], timeout=30)
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        results, elapsed = run_concurrently(
+            send, options['requests'], options['concurrency'],
+            options['warmup'])
+        latencies = sorted(latency for latency, ok in results if ok)
+        errors = len(results) - len(latencies)
+        if not latencies:
+            raise CommandError('Ни один запрос не завершился успешно.')
+        self.stdout.write(
+            f'запросов: {len(results)}, ошибок: {errors}, '
+            f'конкурентность: {options["concurrency"]}\n'
+            f'пропускная способность: {len(results) / elapsed:.1f} rps\n'
+            f'задержка, мс: {describe_latencies(latencies)}'
+        )
@@ -0,0 +1,67 @@
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ingredient_import import (BATCH_SIZE, import_ingredients, read_csv,
+                                   read_json)
+from api.shared_cache import is_shared_cache
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV («название,единица») или JSON '
+            '(массив или JSON Lines объектов name/measurement_unit). '
+            'Повторный запуск не создаёт дубликатов. Без общего кеша '
+            '(CACHE_BACKEND) после загрузки перезапустите приложение: '
+            'индексы ингредиентов в его процессах не сбрасываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл или «-» для stdin.')
+        parser.add_argument('--format', choices=READERS,
+                            help='По умолчанию — по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or Path(path).suffix.lstrip('.')
+        if file_format in ('jsonl', 'ndjson'):
+            file_format = 'json'
+        if file_format not in READERS:
+            raise CommandError('Укажите --format: csv или json.')
+        started = time.perf_counter()
+
+        def report(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'обработано {result.total}, '
+                    f'{result.total / (time.perf_counter() - started):.0f} '
+                    f'строк/с')
+
+        try:
+            if path == '-':
+                sys.stdin.reconfigure(encoding=options['encoding'])
+                result = import_ingredients(
+                    READERS[file_format](sys.stdin),
+                    options['batch_size'], report)
+            else:
+                with open(path, encoding=options['encoding'],
+                          newline='') as file:
+                    result = import_ingredients(
+                        READERS[file_format](file),
+                        options['batch_size'], report)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Добавлено: {result.inserted}, обновлено: {result.updated}, '
+            f'пропущено: {result.skipped}, с ошибками: {result.invalid}.\n'
+            f'{result.total} строк за {elapsed:.1f} с, '
+            f'{result.total / elapsed:.0f} строк/с')
+        if not is_shared_cache():
+            self.stdout.write(self.style.WARNING(
+                'Кеш не общий для процессов: перезапустите приложение, '
+                'чтобы его воркеры увидели изменения каталога.'))
@@ -0,0 +1,385 @@
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark import describe_latencies, run_concurrently
+from .seed import DEFAULT_PASSWORD, DEFAULT_PREFIX
+
+PNG = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+       'AAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+# Сколько объектов каждого вида берётся с сервера для сценариев.
+SAMPLE_SIZE = 100
+# Сколько рецептов меняется одним пакетным запросом.
+BATCH_SIZE = 7
+
+SCENARIOS = {}
+
+
+def scenario(name, admin=False, serial=False):
+    """Регистрирует сценарий нагрузки.
+
+    Сценарий — генератор шагов (метка, метод, путь, параметры requests)
+    для итерации number. admin — нужен токен администратора,
+    serial — итерации нельзя выполнять параллельно.
+    """
+    def register(function):
+        function.admin = admin
+        function.serial = serial
+        SCENARIOS[name] = function
+        return function
+    return register
+
+
+def pick(items, number):
+    return items[number % len(items)]
+
+
+@scenario('auth', serial=True)
+def auth(context, number):
+    response = yield ('POST /api/auth/token/login/', 'post',
+                      '/api/auth/token/login/',
+                      {'json': context.credentials})
+    token = response.json()['auth_token']
+    yield ('POST /api/auth/token/logout/', 'post', '/api/auth/token/logout/',
+           {'headers': {'Authorization': f'Token {token}'}})
+    context.login()
+
+
+@scenario('signup')
+def signup(context, number):
+    name = f'loadtest{uuid.uuid4().hex[:12]}'
+    credentials = {'email': f'{name}@example.com',
+                   'password': DEFAULT_PASSWORD}
+    yield ('POST /api/users/', 'post', '/api/users/', {
+        'json': {**credentials, 'username': name, 'first_name': 'Нагрузка',
+                 'last_name': 'Тест'}})
+    response = yield ('POST /api/auth/token/login/', 'post',
+                      '/api/auth/token/login/', {'json': credentials})
+    headers = {'Authorization': f'Token {response.json()["auth_token"]}'}
+    yield ('DELETE /api/users/me/', 'delete', '/api/users/me/', {
+        'headers': headers,
+        'json': {'current_password': DEFAULT_PASSWORD}})
+
+
+@scenario('users')
+def users(context, number):
+    user = pick(context.users, number)
+    yield 'GET /api/users/', 'get', '/api/users/', {}
+    yield 'GET /api/users/{id}/', 'get', f'/api/users/{user}/', {}
+    yield 'GET /api/users/me/', 'get', '/api/users/me/', {}
+
+
+@scenario('avatar', serial=True)
+def avatar(context, number):
+    yield ('PUT /api/users/me/avatar/', 'put', '/api/users/me/avatar/',
+           {'json': {'avatar': PNG}})
+    yield ('DELETE /api/users/me/avatar/', 'delete',
+           '/api/users/me/avatar/', {})
+
+
+@scenario('set_password')
+def set_password(context, number):
+    password = context.credentials['password']
+    yield ('POST /api/users/set_password/', 'post',
+           '/api/users/set_password/',
+           {'json': {'current_password': password,
+                     'new_password': password}})
+
+
+@scenario('subscriptions')
+def subscriptions(context, number):
+    author = pick(context.unsubscribed, number)
+    yield ('GET /api/users/subscriptions/', 'get',
+           '/api/users/subscriptions/', {})
+    response = yield ('GET /api/recipes/feed/', 'get', '/api/recipes/feed/',
+                      {})
+    if response.json()['next']:
+        link = urlsplit(response.json()['next'])
+        yield ('GET /api/recipes/feed/?cursor=', 'get',
+               f'{link.path}?{link.query}', {})
+    yield ('POST /api/users/{id}/subscribe/', 'post',
+           f'/api/users/{author}/subscribe/', {})
+    yield ('DELETE /api/users/{id}/subscribe/', 'delete',
+           f'/api/users/{author}/subscribe/', {})
+
+
+@scenario('catalog')
+def catalog(context, number):
+    ingredient = pick(context.ingredients, number)
+    tag = pick(context.tags, number)
+    yield ('GET /api/ingredients/?name=', 'get', '/api/ingredients/',
+           {'params': {'name': pick(context.prefixes, number)}})
+    yield ('GET /api/ingredients/{id}/', 'get',
+           f'/api/ingredients/{ingredient}/', {})
+    yield 'GET /api/tags/', 'get', '/api/tags/', {}
+    yield 'GET /api/tags/{id}/', 'get', f'/api/tags/{tag}/', {}
+
+
+@scenario('recipes')
+def recipes(context, number):
+    recipe = pick(context.recipes, number)
+    yield 'GET /api/recipes/', 'get', '/api/recipes/', {
+        'params': {'page': number % 5 + 1}}
+    yield 'GET /api/recipes/?filters', 'get', '/api/recipes/', {
+        'params': {'tags': pick(context.tag_slugs, number),
+                   'is_favorited': number % 2}}
+    yield 'GET /api/recipes/?search=', 'get', '/api/recipes/', {
+        'params': {'search': pick(context.prefixes, number)}}
+    yield 'GET /api/recipes/{id}/', 'get', f'/api/recipes/{recipe}/', {}
+
+
+@scenario('recipe_write')
+def recipe_write(context, number):
+    payload = {
+        'name': f'Нагрузка {uuid.uuid4().hex[:12]}',
+        'text': 'Смешайте всё.',
+        'cooking_time': 10,
+        'image': PNG,
+        'tags': [pick(context.tags, number)],
+        'ingredients': [
+            {'id': pick(context.ingredients, number + shift), 'amount': 10}
+            for shift in range(3)],
+    }
+    response = yield ('POST /api/recipes/', 'post', '/api/recipes/',
+                      {'json': payload})
+    path = f'/api/recipes/{response.json()["id"]}/'
+    yield ('PATCH /api/recipes/{id}/', 'patch', path,
+           {'json': {**payload, 'cooking_time': 20}})
+    yield 'DELETE /api/recipes/{id}/', 'delete', path, {}
+
+
+@scenario('favorite')
+def favorite(context, number):
+    path = f'/api/recipes/{pick(context.not_favorited, number)}/favorite/'
+    yield 'POST /api/recipes/{id}/favorite/', 'post', path, {}
+    yield 'DELETE /api/recipes/{id}/favorite/', 'delete', path, {}
+
+
+@scenario('shopping_cart')
+def shopping_cart(context, number):
+    path = (f'/api/recipes/{pick(context.not_in_cart, number)}'
+            f'/shopping_cart/')
+    yield 'POST /api/recipes/{id}/shopping_cart/', 'post', path, {}
+    yield 'DELETE /api/recipes/{id}/shopping_cart/', 'delete', path, {}
+    yield ('GET /api/recipes/download_shopping_cart/', 'get',
+           '/api/recipes/download_shopping_cart/', {})
+    yield ('GET /api/recipes/shopping_cart/', 'get',
+           '/api/recipes/shopping_cart/', {})
+
+
+@scenario('recipe_lists_batch')
+def recipe_lists_batch(context, number):
+    # Неделя рецептов за раз, как у планировщика меню.
+    for name, ids in (('favorite', context.not_favorited),
+                      ('shopping_cart', context.not_in_cart)):
+        batch = {'json': {'recipes': [pick(ids, number + offset)
+                                      for offset in range(BATCH_SIZE)]}}
+        path = f'/api/recipes/{name}/'
+        yield f'POST {path}', 'post', path, batch
+        yield f'DELETE {path}', 'delete', path, batch
+
+
+@scenario('shopping_cart_export')
+def shopping_cart_export(context, number):
+    response = yield ('POST /api/recipes/shopping_cart_export/', 'post',
+                      '/api/recipes/shopping_cart_export/', {})
+    path = f'/api/recipes/shopping_cart_export/{response.json()["id"]}/'
+    response = yield ('GET /api/recipes/shopping_cart_export/{id}/', 'get',
+                      path, {})
+    # Файл готовит фоновый обработчик; без него скачивать нечего.
+    if response.json()['download']:
+        yield ('GET /api/recipes/shopping_cart_export/{id}/download/',
+               'get', f'{path}download/', {})
+
+
+@scenario('short_links')
+def short_links(context, number):
+    recipe = pick(context.recipes, number)
+    response = yield ('GET /api/recipes/{id}/get-link/', 'get',
+                      f'/api/recipes/{recipe}/get-link/', {})
+    yield ('GET /s/{code}', 'get',
+           urlsplit(response.json()['short-link']).path,
+           {'allow_redirects': False})
+
+
+@scenario('admin', admin=True)
+def admin(context, number):
+    yield ('GET /api/recipes/cache_stats/', 'get',
+           '/api/recipes/cache_stats/', {})
+    yield 'GET /api/metrics', 'get', '/api/metrics', {}
+
+
+@scenario('recipe_transfer', admin=True)
+def recipe_transfer(context, number):
+    # Выгрузка за сутки, а не всей базы: так итерации сопоставимы
+    # между прогонами на базах разного размера.
+    since = datetime.now(timezone.utc) - timedelta(days=1)
+    yield ('GET /api/recipes/export/', 'get', '/api/recipes/export/',
+           {'params': {'updated_since': since.isoformat()}})
+    lines = ''.join(json.dumps({
+        'name': f'Перенос {uuid.uuid4().hex[:12]}',
+        'text': 'Смешайте всё.',
+        'cooking_time': 10,
+        'image': PNG,
+        'tags': [pick(context.tag_slugs, number)],
+        'ingredients': [
+            {'name': name, 'measurement_unit': unit, 'amount': 10}
+            for name, unit in (
+                pick(context.ingredient_names, number + shift)
+                for shift in range(3))],
+    }, ensure_ascii=False) + '\n' for _ in range(BATCH_SIZE))
+    yield ('POST /api/recipes/import/', 'post', '/api/recipes/import/', {
+        'data': lines.encode(),
+        'headers': {'Content-Type': 'application/x-ndjson'}})
+
+
+class Context:
+    """Данные с сервера, на которых строятся сценарии."""
+
+    def __init__(self, base_url, credentials, admin_token):
+        self.base_url = base_url.rstrip('/')
+        self.credentials = credentials
+        self.admin_token = admin_token
+        self.token = None
+        self.login()
+        me = self.get('/api/users/me/')
+        users = self.get('/api/users/', limit=SAMPLE_SIZE)['results']
+        self.users = [user['id'] for user in users]
+        self.unsubscribed = [user['id'] for user in users
+                             if not user['is_subscribed']
+                             and user['id'] != me['id']]
+        recipes = self.get('/api/recipes/', limit=SAMPLE_SIZE)['results']
+        self.recipes = [recipe['id'] for recipe in recipes]
+        self.not_favorited = [recipe['id'] for recipe in recipes
+                              if not recipe['is_favorited']]
+        self.not_in_cart = [recipe['id'] for recipe in recipes
+                            if not recipe['is_in_shopping_cart']]
+        ingredients = self.get('/api/ingredients/')[:SAMPLE_SIZE]
+        self.ingredients = [item['id'] for item in ingredients]
+        self.ingredient_names = [(item['name'], item['measurement_unit'])
+                                 for item in ingredients]
+        self.prefixes = sorted({item['name'][:3] for item in ingredients})
+        tags = self.get('/api/tags/')
+        self.tags = [tag['id'] for tag in tags]
+        self.tag_slugs = [tag['slug'] for tag in tags]
+        for name in ('users', 'unsubscribed', 'recipes', 'not_favorited',
+                     'not_in_cart', 'ingredients', 'tags'):
+            if not getattr(self, name):
+                raise CommandError(
+                    f'На сервере не хватает данных ({name}); '
+                    f'заполните базу командой seed.')
+
+    def url(self, path):
+        return f'{self.base_url}{path}'
+
+    def login(self):
+        response = requests.post(self.url('/api/auth/token/login/'),
+                                 json=self.credentials, timeout=30)
+        if response.status_code != 200:
+            raise CommandError(f'Не удалось войти: {response.text}')
+        self.token = response.json()['auth_token']
+
+    def get(self, path, **params):
+        response = requests.get(
+            self.url(path), params=params, timeout=30,
+            headers={'Authorization': f'Token {self.token}'})
+        response.raise_for_status()
+        return response.json()
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет сценарии нагрузки по всем адресам API против '
+            'запущенного сервера и выводит пропускную способность и '
+            'перцентили задержки каждого адреса. Базу удобно заполнить '
+            'командой seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--scenario', action='append',
+                            choices=sorted(SCENARIOS),
+                            help='Сценарий; можно указать несколько. '
+                                 'По умолчанию — все.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Итераций на сценарий.')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--email',
+                            default=f'{DEFAULT_PREFIX}0@example.com')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--admin-token',
+                            help='Токен администратора для сценария admin.')
+
+    def handle(self, *args, **options):
+        try:
+            context = Context(
+                options['base_url'],
+                {'email': options['email'],
+                 'password': options['password']},
+                options['admin_token'])
+        except requests.RequestException as error:
+            raise CommandError(f'Сервер недоступен: {error}')
+        failed = False
+        for name in options['scenario'] or SCENARIOS:
+            function = SCENARIOS[name]
+            if function.admin and not context.admin_token:
+                self.stdout.write(f'{name}: пропущен, нужен --admin-token')
+                continue
+            failed |= self.run_scenario(name, function, context, options)
+        if failed:
+            raise CommandError('Часть запросов завершилась ошибкой.')
+
+    def run_scenario(self, name, function, context, options):
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        local = threading.local()
+
+        def iterate(number):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            token = context.admin_token if function.admin else context.token
+            local.session.headers['Authorization'] = f'Token {token}'
+            steps = function(context, number)
+            response = None
+            try:
+                while True:
+                    label, method, path, kwargs = steps.send(response)
+                    started = time.perf_counter()
+                    try:
+                        response = local.session.request(
+                            method, context.url(path), timeout=30, **kwargs)
+                        failed = response.status_code >= 400
+                    except requests.RequestException:
+                        failed = True
+                    with lock:
+                        latencies[label].append(
+                            time.perf_counter() - started)
+                        errors[label] += failed
+                    if failed:
+                        return
+            except StopIteration:
+                pass
+
+        concurrency = 1 if function.serial else options['concurrency']
+        run_concurrently(iterate, options['warmup'], concurrency)
+        latencies.clear()
+        errors.clear()
+        _, elapsed = run_concurrently(
+            iterate, options['requests'], concurrency)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{name} (конкурентность {concurrency}, {elapsed:.1f} с)'))
+        for label, values in latencies.items():
+            values.sort()
+            self.stdout.write(
+                f'  {label}: {len(values)} запросов, '
+                f'ошибок {errors[label]}, '
+                f'{len(values) / elapsed:.1f} rps, мс: '
+                f'{describe_latencies(values)}')
+        return any(errors.values())
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.images import make_renditions, renditions_ready, touch_recipes
+from recipes.models import Recipe
+from users.models import MyUser
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии изображений рецептов и аватаров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии, даже если они уже есть.')
+
+    def handle(self, *args, **options):
+        names = set(
+            Recipe.objects.exclude(image='').values_list('image', flat=True))
+        names.update(MyUser.objects.exclude(avatar='').exclude(
+            avatar__isnull=True).values_list('avatar', flat=True))
+        created = 0
+        for name in sorted(names):
+            if not options['force'] and renditions_ready(name):
+                continue
+            try:
+                make_renditions(name)
+            except Exception as error:
+                self.stderr.write(f'{name}: {error}')
+                continue
+            touch_recipes(Recipe.objects.filter(
+                Q(image=name) | Q(author__avatar=name)))
+            created += 1
+        self.stdout.write(f'Обработано изображений: {created}')
@@ -0,0 +1,304 @@
+import itertools
+import random
+import time
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.images import make_renditions
+from api.ingredient_import import import_ingredients, read_csv
+from recipes.counters import recount
+from recipes.feed import rebuild as rebuild_feeds
+from recipes.models import (MAX_CHARFIELD_LENGHT, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart, Tag)
+from recipes.search import update_search_index
+from recipes.shopping_cart import rebuild as rebuild_totals
+from users.models import MyUser, Subscription
+
+DEFAULT_PASSWORD = 'foodgram-seed'
+DEFAULT_PREFIX = 'seed'
+IMAGE_NAME = 'seed/recipe.jpg'
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'),
+    ('Выпечка', 'baking'),
+    ('Вегетарианское', 'vegetarian'),
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Дмитрий',
+               'Елена', 'Сергей', 'Наталья', 'Алексей')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+              'Соколов', 'Михайлов', 'Новиков', 'Фёдоров', 'Морозов')
+DISHES = ('Салат', 'Суп', 'Запеканка', 'Рагу', 'Пирог', 'Паста', 'Омлет',
+          'Каша', 'Гратен', 'Рулет', 'Смузи', 'Жаркое')
+# Количество ингредиентов в рецепте: значения и их веса.
+INGREDIENTS_PER_RECIPE = (range(2, 16),
+                          (2, 5, 9, 13, 15, 14, 12, 9, 7, 5, 4, 2, 1, 1))
+# Типичные количества по единицам измерения.
+AMOUNTS = {
+    'г': (10, 50, 100, 150, 200, 250, 300, 500, 1000),
+    'кг': (1, 2),
+    'мл': (5, 15, 50, 100, 200, 250, 500),
+    'л': (1, 2),
+    'шт.': (1, 2, 3, 4, 6, 10),
+}
+DEFAULT_AMOUNTS = (1, 2, 3, 5)
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса закона Ципфа для ранжированной совокупности."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+def sample_distinct(rng, population, cum_weights, count):
+    """count разных элементов population, выбранных по весам."""
+    count = min(count, len(population))
+    chosen = {}
+    while len(chosen) < count:
+        for item in rng.choices(population, cum_weights=cum_weights,
+                                k=count - len(chosen)):
+            chosen[item] = None
+    return list(chosen)
+
+
+def draw_count(rng, mean, limit):
+    """Число с экспоненциальным распределением: у многих мало, у единиц
+    много."""
+    if mean <= 0:
+        return 0
+    return min(int(rng.expovariate(1 / mean)), limit)
+
+
+def batched(items, size):
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу пользователями, рецептами, избранным, '
+            'корзинами и подписками для нагрузочного тестирования.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--authors-share', type=float, default=0.2,
+            help='Доля пользователей, публикующих рецепты.')
+        parser.add_argument(
+            '--favorites', type=float, default=10,
+            help='Среднее число избранных рецептов на пользователя.')
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Среднее число рецептов в корзине пользователя.')
+        parser.add_argument(
+            '--subscriptions', type=float, default=8,
+            help='Среднее число подписок на пользователя.')
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель степенного закона популярности.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Зерно генератора для повторяемости.')
+        parser.add_argument('--prefix', default=DEFAULT_PREFIX,
+                            help='Префикс имён создаваемых пользователей.')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument(
+            '--ingredients-csv', type=Path,
+            default=settings.BASE_DIR / 'ingredients.csv')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно хотя бы два пользователя и один рецепт.')
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        with transaction.atomic():
+            ingredients = self.ensure_ingredients()
+            tags = self.ensure_tags()
+            users = self.create_users()
+            recipes = self.create_recipes(users, ingredients, tags)
+            self.create_relations(users, recipes, Favorite,
+                                  options['favorites'])
+            self.create_relations(users, recipes, ShoppingCart,
+                                  options['carts'])
+            self.create_subscriptions(users)
+            self.stage('Счётчики', recount)
+            self.stage('Итоги корзин', rebuild_totals)
+            self.stage('Ленты подписок', rebuild_feeds)
+            self.stage('Поисковый индекс', lambda: [
+                update_search_index(batch)
+                for batch in batched(recipes, self.batch_size)])
+        user = MyUser.objects.get(pk=users[0])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.stdout.write(
+            f'Готово за {time.perf_counter() - started:.1f} с.\n'
+            f'Вход: {user.email} / {options["password"]}, '
+            f'токен {token.key}')
+
+    def stage(self, title, function):
+        started = time.perf_counter()
+        result = function()
+        self.stdout.write(
+            f'{title}: {time.perf_counter() - started:.1f} с')
+        return result
+
+    def ensure_ingredients(self):
+        """Загружает ингредиенты из CSV и возвращает список всех."""
+        path = self.options['ingredients_csv']
+        try:
+            with path.open(encoding='utf-8', newline='') as file:
+                self.stage('Ингредиенты', lambda: import_ingredients(
+                    read_csv(file), self.batch_size))
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось загрузить {path}: {error}')
+        ingredients = list(
+            Ingredient.objects.values_list('pk', 'name', 'measurement_unit'))
+        # Популярность ингредиента не зависит от алфавита.
+        self.rng.shuffle(ingredients)
+        return ingredients
+
+    def ensure_tags(self):
+        for name, slug in DEFAULT_TAGS:
+            Tag.objects.get_or_create(slug=slug, defaults={'name': name})
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        self.rng.shuffle(tags)
+        return tags
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        offset = MyUser.objects.filter(username__startswith=prefix).count()
+        password = make_password(self.options['password'])
+
+        def generate():
+            for number in range(offset, offset + self.options['users']):
+                yield MyUser(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    password=password,
+                )
+
+        users = self.stage('Пользователи', lambda: [
+            user.pk for user in MyUser.objects.bulk_create(
+                generate(), batch_size=self.batch_size)])
+        if users[0] is None:
+            raise CommandError('База не вернула id созданных строк.')
+        return users
+
+    def create_recipes(self, users, ingredients, tags):
+        rng = self.rng
+        image = self.ensure_image()
+        authors = users[:max(int(len(users) * self.options['authors_share']),
+                             1)]
+        author_weights = zipf_weights(len(authors), self.options['exponent'])
+        ingredient_weights = zipf_weights(len(ingredients),
+                                          self.options['exponent'])
+        tag_weights = zipf_weights(len(tags), self.options['exponent'])
+        sizes, size_weights = INGREDIENTS_PER_RECIPE
+        numbers = itertools.count(Recipe.objects.count() + 1)
+
+        def make_recipe():
+            components = sample_distinct(
+                rng, ingredients, ingredient_weights,
+                rng.choices(sizes, size_weights)[0])
+            title = (f'{rng.choice(DISHES)}: {components[0][1]}, '
+                     f'{components[-1][1]}')[:MAX_CHARFIELD_LENGHT - 10]
+            recipe = Recipe(
+                author_id=rng.choices(authors, cum_weights=author_weights)[0],
+                name=f'{title} №{next(numbers)}',
+                text='\n'.join(
+                    f'{step}. Добавьте {name}.'
+                    for step, (_, name, _) in enumerate(components, 1)),
+                cooking_time=max(1, min(int(rng.lognormvariate(3.4, 0.7)),
+                                        600)),
+                image=image,
+            )
+            amounts = [
+                (pk, rng.choice(AMOUNTS.get(unit, DEFAULT_AMOUNTS)))
+                for pk, _, unit in components
+            ]
+            recipe_tags = sample_distinct(rng, tags, tag_weights,
+                                          rng.randint(1, 3))
+            return recipe, amounts, recipe_tags
+
+        def create():
+            created = []
+            through = Recipe.tags.through
+            for batch in batched(range(self.options['recipes']),
+                                 self.batch_size):
+                rows = [make_recipe() for _ in batch]
+                Recipe.objects.bulk_create(row[0] for row in rows)
+                IngredientRecipe.objects.bulk_create(
+                    IngredientRecipe(recipe_id=recipe.pk, ingredient_id=pk,
+                                     amount=amount)
+                    for recipe, amounts, _ in rows
+                    for pk, amount in amounts)
+                through.objects.bulk_create(
+                    through(recipe_id=recipe.pk, tag_id=tag)
+                    for recipe, _, recipe_tags in rows
+                    for tag in recipe_tags)
+                created.extend(row[0].pk for row in rows)
+            return created
+
+        return self.stage('Рецепты', create)
+
+    def create_relations(self, users, recipes, model, mean):
+        """Избранное или корзины: популярные рецепты встречаются чаще."""
+        ranked = recipes[:]
+        self.rng.shuffle(ranked)
+        weights = zipf_weights(len(ranked), self.options['exponent'])
+
+        def generate():
+            for user in users:
+                count = draw_count(self.rng, mean, len(ranked))
+                for recipe in sample_distinct(self.rng, ranked, weights,
+                                              count):
+                    yield model(user_id=user, recipe_id=recipe)
+
+        self.stage(model._meta.verbose_name_plural, lambda: (
+            model.objects.bulk_create(generate(),
+                                      batch_size=self.batch_size)))
+
+    def create_subscriptions(self, users):
+        """Граф подписок со степенным распределением подписчиков.
+
+        Авторы стоят в начале списка, поэтому популярными чаще
+        оказываются те, у кого есть рецепты.
+        """
+        weights = zipf_weights(len(users), self.options['exponent'])
+
+        def generate():
+            for user in users:
+                count = draw_count(self.rng, self.options['subscriptions'],
+                                   len(users) - 1)
+                for author in sample_distinct(self.rng, users, weights,
+                                              count + 1):
+                    if author != user and count:
+                        count -= 1
+                        yield Subscription(subscriber_id=user,
+                                           subscribed_to_id=author)
+
+        self.stage('Подписки', lambda: Subscription.objects.bulk_create(
+            generate(), batch_size=self.batch_size))
+
+    def ensure_image(self):
+        """Общая для всех рецептов картинка с готовыми копиями."""
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (960, 640), (226, 136, 84)).save(buffer, 'JPEG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+            make_renditions(IMAGE_NAME)
+        return IMAGE_NAME
@@ -1,6 +1,105 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core import signing
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_SALT = 'api.pagination.cursor'
+
+
+class SignedCursorPaginator(CursorPagination):
+    """Пагинация по ключу -id с подписанным курсором.
+
+    Вместо COUNT(*) и OFFSET выбирает следующую страницу условием на id,
+    поэтому стоимость не зависит от глубины страницы.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            offset, reverse, position = signing.loads(
+                encoded, salt=CURSOR_SALT)
+            return Cursor(offset=int(offset), reverse=bool(reverse),
+                          position=position)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        encoded = signing.dumps(
+            (cursor.offset, int(cursor.reverse), cursor.position),
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
 
 
 class MyPageNumberPaginator(PageNumberPagination):
+    """Постраничная выдача page/limit; с параметром cursor — по ключу."""
+
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = SignedCursorPaginator()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_etag_parts(self):
+        """Всё, кроме самих объектов, от чего зависит ответ страницы."""
+        if self.cursor_paginator is not None:
+            return (self.cursor_paginator.get_next_link(),
+                    self.cursor_paginator.get_previous_link())
+        return (self.page.paginator.count,)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPaginator(SignedCursorPaginator):
+    """Подписанный курсор SignedCursorPaginator для ленты подписок.
+
+    Страницу выбирает не запрос к queryset, а функция fetch(before,
+    limit), возвращающая id не больше limit рецептов с id меньше before.
+    Лента листается только вперёд: previous всегда null.
+    """
+
+    max_page_size = 100
+
+    def paginate_ids(self, fetch, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        before = None
+        if cursor is not None:
+            try:
+                before = int(cursor.position)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        ids = fetch(before, self.page_size + 1)
+        self.has_next = len(ids) > self.page_size
+        self.has_previous = False
+        self.page = ids[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.page[-1]))
+
+    def get_previous_link(self):
+        return None
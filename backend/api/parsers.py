@@ -0,0 +1,29 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Тело запроса слишком велико.'
+    default_code = 'request_too_large'
+
+
+class LimitedJSONParser(JSONParser):
+    """JSONParser, отклоняющий тело больше JSON_MAX_BODY_SIZE до разбора.
+
+    DRF читает request.stream сам, и DATA_UPLOAD_MAX_MEMORY_SIZE к JSON
+    не применяется: без проверки картинка в base64 любого размера
+    целиком разбиралась бы в память раньше проверки её размера.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > settings.JSON_MAX_BODY_SIZE:
+            raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
@@ -0,0 +1,71 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление сделало больше запросов к базе, чем объявило."""
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def get_query_budget(request, view_func):
+    """Бюджет запросов представления или None, если он не объявлен.
+
+    Вьюсеты задают словарь query_budgets {действие: число запросов}
+    или {действие: {метод: число запросов}} для действий с несколькими
+    методами, обычные функции — атрибут query_budget.
+    """
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None)
+    budgets = getattr(getattr(view_func, 'cls', None), 'query_budgets', None)
+    if actions and budgets:
+        budget = budgets.get(actions.get(method))
+        if isinstance(budget, dict):
+            return budget.get(method)
+        return budget
+    return getattr(view_func, 'query_budget', None)
+
+
+class QueryBudgetMiddleware:
+    """Считает запросы к базе за запрос и сверяет их с бюджетом view.
+
+    QUERY_BUDGET_MODE: 'log' пишет предупреждение, 'raise' бросает
+    QueryBudgetExceeded (для тестов), 'off' (по умолчанию) убирает
+    middleware из цепочки. Middleware синхронное, поэтому под ASGI
+    его не включают: каждый запрос шёл бы через sync_to_async, а
+    асинхронные представления ходят в базу из других потоков.
+    """
+
+    def __init__(self, get_response):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and counter.count > budget:
+            message = (f'{request.method} {request.path}: '
+                       f'{counter.count} запросов при бюджете {budget}')
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(request, view_func)
@@ -0,0 +1,182 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import MyUser
+from . import shared_cache
+
+VERSION_CACHE_KEY = 'recipe-version'
+GLOBAL_VERSION = 'all'
+
+
+class CacheStats:
+    """Счётчики кеша рецептов в рамках одного процесса."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+        }
+
+
+stats = CacheStats()
+
+
+def get_versions(recipe_ids):
+    """Версии рецептов recipe_ids и общая версия GLOBAL_VERSION."""
+    keys = {recipe_id: f'{VERSION_CACHE_KEY}:{recipe_id}'
+            for recipe_id in (GLOBAL_VERSION, *recipe_ids)}
+    versions = shared_cache.get_versions(list(keys.values()))
+    return {recipe_id: versions[key] for recipe_id, key in keys.items()}
+
+
+def get_user_overlay(user, recipes):
+    """Id рецептов в избранном, в корзине и id авторов в подписках user.
+
+    Берёт флаги из аннотаций Recipe.objects.with_user_flags(), а для
+    неаннотированных рецептов делает по одному запросу на всю пачку.
+    """
+    if user.is_anonymous:
+        return set(), set(), set()
+    favorited = {recipe.pk for recipe in recipes
+                 if getattr(recipe, 'is_favorited', False)}
+    in_cart = {recipe.pk for recipe in recipes
+               if getattr(recipe, 'is_in_shopping_cart', False)}
+    unannotated = [recipe.pk for recipe in recipes
+                   if not hasattr(recipe, 'is_favorited')]
+    if unannotated:
+        favorited.update(user.favorite.filter(
+            recipe__in=unannotated).values_list('recipe_id', flat=True))
+        in_cart.update(user.shopping_cart.filter(
+            recipe__in=unannotated).values_list('recipe_id', flat=True))
+    subscribed = set(user.subscriptions.filter(
+        subscribed_to__in={recipe.author_id for recipe in recipes}
+    ).values_list('subscribed_to_id', flat=True))
+    return favorited, in_cart, subscribed
+
+
+def render(serializer, recipes):
+    """Представления рецептов: общая часть из кеша, личная — поверх.
+
+    Счётчики избранного и корзины меняются часто и берутся из самой
+    строки рецепта, а не из кеша.
+
+    serializer.build_representation() вызывается только для промахов,
+    перед этим связанные объекты промахов подгружаются пачкой. Без
+    общего кеша (is_shared_cache) промахами считаются все рецепты.
+    """
+    request = serializer.context['request']
+    favorited, in_cart, subscribed = get_user_overlay(request.user, recipes)
+    shared = shared_cache.is_shared_cache()
+    if shared:
+        versions = get_versions([recipe.pk for recipe in recipes])
+        host = request.build_absolute_uri('/')
+        keys = {
+            recipe.pk: (f'recipe:{host}:{recipe.pk}:'
+                        f'{versions[GLOBAL_VERSION]}:{versions[recipe.pk]}')
+            for recipe in recipes
+        }
+        cached = cache.get_many(keys.values())
+    else:
+        keys = {recipe.pk: recipe.pk for recipe in recipes}
+        cached = {}
+    misses = [recipe for recipe in recipes if keys[recipe.pk] not in cached]
+    stats.hits += len(recipes) - len(misses)
+    stats.misses += len(misses)
+    if misses:
+        prefetch_related_objects(
+            misses,
+            'author',
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient')
+            ),
+        )
+        fresh = {}
+        for recipe in misses:
+            recipe.author.is_subscribed = False
+            recipe.is_favorited = recipe.is_in_shopping_cart = False
+            fresh[keys[recipe.pk]] = serializer.build_representation(recipe)
+        if shared:
+            cache.set_many(fresh, settings.RECIPE_CACHE_TIMEOUT)
+        cached.update(fresh)
+    representations = []
+    for recipe in recipes:
+        representation = dict(cached[keys[recipe.pk]])
+        representation['author'] = dict(
+            representation['author'],
+            is_subscribed=recipe.author_id in subscribed
+        )
+        representation['is_favorited'] = recipe.pk in favorited
+        representation['is_in_shopping_cart'] = recipe.pk in in_cart
+        representation['favorites_count'] = recipe.favorites_count
+        representation['shopping_cart_count'] = recipe.shopping_cart_count
+        representations.append(representation)
+    return representations
+
+
+def invalidate(recipe_ids):
+    """Сбрасывает кеш рецептов recipe_ids, None — всех рецептов.
+
+    Версии меняются после коммита: GET из другого воркера, пришедший
+    до него, сохранит старое представление под старой версией.
+    """
+    if not shared_cache.is_shared_cache():
+        return
+    if recipe_ids is None:
+        recipe_ids = (GLOBAL_VERSION,)
+    shared_cache.bump_versions(
+        f'{VERSION_CACHE_KEY}:{recipe_id}' for recipe_id in recipe_ids)
+    stats.invalidations += len(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def invalidate_recipe_ingredient(instance, **kwargs):
+    invalidate([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate([instance.pk])
+    elif pk_set:
+        invalidate(pk_set)
+    else:
+        invalidate(None)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_catalog(**kwargs):
+    invalidate(None)
+
+
+@receiver(post_save, sender=MyUser)
+def invalidate_author(instance, update_fields, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate(list(instance.recipes.values_list('id', flat=True)))
@@ -0,0 +1,63 @@
+"""Пакетное изменение избранного и корзины пользователя.
+
+Каждая операция — одна команда INSERT … ON CONFLICT DO NOTHING или
+DELETE с RETURNING: строки, которые уже были (или которых не было),
+не меняются и не попадают в ответ. Сигналы при этом не отправляются,
+поэтому счётчики рецептов и итоги корзины обновляются здесь же.
+"""
+from django.db import connection, transaction
+
+from recipes.counters import change_counters
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.shopping_cart import change_totals
+from recipes.sql import column, insert_select, placeholders, table
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты recipe_ids в список model пользователя user.
+
+    Несуществующие id пропускаются. Возвращает отсортированные id
+    добавленных рецептов.
+    """
+    recipe_ids = sorted(set(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(insert_select(
+            model, ('user', 'recipe'),
+            f'SELECT %s, id FROM {table(Recipe)} '
+            f'WHERE id IN ({placeholders(recipe_ids)})',
+            returning='recipe'), [user.pk, *recipe_ids])
+        added = sorted(row[0] for row in cursor.fetchall())
+    if added:
+        change_counters(Recipe, added, COUNTER_FIELDS[model], 1)
+        if model is ShoppingCart:
+            change_totals(user.pk, added, 1)
+    return added
+
+
+@transaction.atomic
+def remove_recipes(model, user, recipe_ids):
+    """Убирает рецепты recipe_ids из списка model пользователя user.
+
+    Возвращает отсортированные id рецептов, которые были в списке.
+    """
+    recipe_ids = sorted(set(recipe_ids))
+    recipe_column = column(model, 'recipe')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table(model)} '
+            f'WHERE {column(model, "user")} = %s '
+            f'AND {recipe_column} IN ({placeholders(recipe_ids)}) '
+            f'RETURNING {recipe_column}',
+            [user.pk, *recipe_ids])
+        removed = sorted(row[0] for row in cursor.fetchall())
+    if removed:
+        change_counters(Recipe, removed, COUNTER_FIELDS[model], -1)
+        if model is ShoppingCart:
+            change_totals(user.pk, removed, -1)
+    return removed
@@ -0,0 +1,274 @@
+"""Выгрузка и загрузка рецептов в NDJSON: один рецепт на строку.
+
+Ингредиенты передаются названием и единицей, теги — слагом, автор —
+email, поэтому файл переносим между базами.
+"""
+import json
+from collections import Counter
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+
+from recipes.counters import change_counter
+from recipes.feed import fan_out
+from recipes.models import MAX_CHARFIELD_LENGHT, IngredientRecipe, Recipe
+from recipes.search import update_search_index
+from users.models import MyUser
+from .images import schedule_renditions
+from .ingredient_import import find_ingredients, normalise
+from .serializer import (MAX_AMOUNT, MAX_COOKING_TIME, MIN_AMOUNT,
+                         MIN_COOKING_TIME, Base64ImageField)
+from .tag_index import tag_index
+
+CHUNK_SIZE = 500
+# Ошибки строк сверх этого числа только считаются, чтобы ответ
+# на файл из одних ошибок не рос вместе с файлом.
+MAX_ERRORS = 100
+CONTENT_TYPE = 'application/x-ndjson'
+
+
+def export_recipes(queryset, request):
+    """Строки NDJSON с рецептами queryset.
+
+    Рецепты читаются серверным курсором пачками по CHUNK_SIZE; состав
+    и теги подгружаются на каждую пачку отдельным запросом.
+    """
+    recipes = queryset.select_related('author').prefetch_related(
+        Prefetch('recipe_ingredients',
+                 IngredientRecipe.objects.select_related('ingredient')),
+        'tags',
+    ).defer('search_vector').order_by('id')
+    for recipe in recipes.iterator(chunk_size=CHUNK_SIZE):
+        yield json.dumps({
+            'id': recipe.pk,
+            'author': recipe.author.email,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': recipe.image.name,
+            'image_url': request.build_absolute_uri(recipe.image.url),
+            'pub_date': recipe.pub_date.isoformat(),
+            'updated_at': recipe.updated_at.isoformat(),
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [{
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            } for item in recipe.recipe_ingredients.all()],
+        }, ensure_ascii=False) + '\n'
+
+
+def read_lines(stream):
+    """Пары (номер строки, объект или ошибка разбора); пустые строки
+    пропускаются."""
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as error:
+            yield number, ValidationError(f'Некорректный JSON: {error}')
+
+
+def check_int(errors, data, field, low, high):
+    value = data.get(field)
+    if (not isinstance(value, int) or isinstance(value, bool)
+            or not low <= value <= high):
+        errors[field] = [f'Ожидается целое число от {low} до {high}.']
+    return value
+
+
+def check_text(errors, data, field, max_length=None):
+    value = data.get(field)
+    if not isinstance(value, str) or not value.strip():
+        errors[field] = ['Обязательное поле.']
+    elif max_length and len(value) > max_length:
+        errors[field] = [f'Не длиннее {max_length} символов.']
+    return value
+
+
+class RecipeImporter:
+    """Загружает строки NDJSON пачками по CHUNK_SIZE.
+
+    Ссылки пачки (авторы, ингредиенты, существующие рецепты) читаются
+    заранее несколькими запросами, затем каждая строка проверяется без
+    обращений к базе. Корректные рецепты пачки пишутся bulk_create в
+    одной транзакции; ошибки копятся по номерам строк (первые
+    MAX_ERRORS).
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, stream):
+        chunk = []
+        for number, data in read_lines(stream):
+            chunk.append((number, data))
+            if len(chunk) == CHUNK_SIZE:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def add_error(self, number, error):
+        self.failed += 1
+        if len(self.errors) >= MAX_ERRORS:
+            return
+        if isinstance(error, ValidationError):
+            error = error.detail
+        self.errors.append({'line': number, 'errors': error})
+
+    def import_chunk(self, chunk):
+        objects = [data for _, data in chunk if isinstance(data, dict)]
+        authors = {
+            user.email: user for user in MyUser.objects.filter(email__in={
+                data['author'] for data in objects
+                if isinstance(data.get('author'), str)})}
+        pairs = {
+            (normalise(item['name']), normalise(item['measurement_unit']))
+            for data in objects
+            if isinstance(data.get('ingredients'), list)
+            for item in data['ingredients']
+            if isinstance(item, dict)
+            and isinstance(item.get('name'), str)
+            and isinstance(item.get('measurement_unit'), str)
+        }
+        ingredients = {key: found[0].pk
+                       for key, found in find_ingredients(pairs).items()}
+        existing = set(Recipe.objects.filter(
+            author__in=list(authors.values()) + [self.user],
+            name__in={data['name'] for data in objects
+                      if isinstance(data.get('name'), str)},
+        ).values_list('author_id', 'name'))
+        rows = []
+        for number, data in chunk:
+            try:
+                if isinstance(data, ValidationError):
+                    raise data
+                if not isinstance(data, dict):
+                    raise ValidationError('Ожидается объект.')
+                row = self.clean(data, authors, ingredients)
+            except ValidationError as error:
+                self.add_error(number, error)
+                continue
+            key = (row[0].author_id, row[0].name)
+            if key in existing:
+                self.add_error(number, {'name': [
+                    'У автора уже есть рецепт с таким названием.']})
+                continue
+            existing.add(key)
+            rows.append(row)
+        if rows:
+            self.save(rows)
+
+    def clean(self, data, authors, ingredients):
+        """Непроверенная строка → (Recipe, [(id, количество)], [id тегов]).
+        """
+        errors = {}
+        name = check_text(errors, data, 'name', MAX_CHARFIELD_LENGHT)
+        text = check_text(errors, data, 'text')
+        cooking_time = check_int(errors, data, 'cooking_time',
+                                 MIN_COOKING_TIME, MAX_COOKING_TIME)
+        author = self.user
+        if 'author' in data:
+            author = (authors.get(data['author'])
+                      if isinstance(data['author'], str) else None)
+            if author is None:
+                errors['author'] = ['Пользователь не найден.']
+        tags = data.get('tags')
+        tag_ids = []
+        if not isinstance(tags, list) or not tags:
+            errors['tags'] = ['Нужен непустой список слагов.']
+        else:
+            tag_ids = [tag_index.get(slug) if isinstance(slug, str)
+                       else None for slug in tags]
+            if None in tag_ids:
+                errors['tags'] = ['Тег не найден.']
+            elif len(set(tag_ids)) != len(tag_ids):
+                errors['tags'] = ['Теги повторяются!']
+        amounts = []
+        items = data.get('ingredients')
+        if not isinstance(items, list) or not items:
+            errors['ingredients'] = ['Нужен непустой список ингредиентов.']
+        else:
+            item_errors = {}
+            for index, item in enumerate(items):
+                item_error = {}
+                if not isinstance(item, dict):
+                    item_errors[index] = ['Ожидается объект.']
+                    continue
+                amount = check_int(item_error, item, 'amount',
+                                   MIN_AMOUNT, MAX_AMOUNT)
+                try:
+                    pk = ingredients.get((
+                        normalise(item['name']).lower(),
+                        normalise(item['measurement_unit']).lower()))
+                except (KeyError, AttributeError):
+                    pk = None
+                if pk is None:
+                    item_error['name'] = ['Ингредиент не найден!']
+                if item_error:
+                    item_errors[index] = item_error
+                else:
+                    amounts.append((pk, amount))
+            if item_errors:
+                errors['ingredients'] = item_errors
+            elif len({pk for pk, _ in amounts}) != len(amounts):
+                errors['ingredients'] = ['Ингредиенты повторяются!']
+        image = self.clean_image(errors, data.get('image'))
+        if errors:
+            raise ValidationError(errors)
+        recipe = Recipe(author=author, name=name, text=text,
+                        cooking_time=cooking_time, image=image)
+        return recipe, amounts, tag_ids
+
+    def clean_image(self, errors, value):
+        """Картинка data:-адресом или имя файла, уже лежащего в хранилище.
+        """
+        if isinstance(value, str) and value.startswith('data:image'):
+            try:
+                return Base64ImageField().run_validation(value)
+            except (ValidationError, ValueError) as error:
+                errors['image'] = getattr(
+                    error, 'detail', ['Некорректное изображение.'])
+                return None
+        try:
+            exists = isinstance(value, str) and default_storage.exists(value)
+        except (SuspiciousFileOperation, ValueError):
+            # Путь вне MEDIA_ROOT («../») или с недопустимыми символами.
+            exists = False
+        if not exists:
+            errors['image'] = ['Файл изображения не найден.']
+        return value
+
+    @transaction.atomic
+    def save(self, rows):
+        recipes = Recipe.objects.bulk_create(row[0] for row in rows)
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+            for recipe, amounts, _ in rows for pk, amount in amounts)
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            through(recipe=recipe, tag_id=tag_id)
+            for recipe, _, tag_ids in rows for tag_id in tag_ids)
+        # bulk_create не отправляет post_save: счётчики, поиск, ленты
+        # подписчиков и копии изображений обновляются здесь.
+        for author_id, count in Counter(
+                recipe.author_id for recipe in recipes).items():
+            change_counter(MyUser, author_id, 'recipes_count', count)
+        update_search_index([recipe.pk for recipe in recipes])
+        fan_out([recipe.pk for recipe in recipes])
+        for name in {recipe.image.name for recipe in recipes}:
+            schedule_renditions(name, Recipe.objects.filter(image=name))
+        self.created += len(recipes)
@@ -1,22 +1,61 @@
-import base64
-
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.db import models, transaction
+from django.urls import reverse
 from djoser.serializers import UserSerializer
 
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.relations import SlugRelatedField
+from jobs.models import Job
 from users.models import Subscription, MyUser
 
+from . import recipe_cache
+from .images import decode_base64_image, get_rendition_urls
 from .pagination import MyPageNumberPaginator
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartTotal, ShortLink, Tag)
+from recipes.shopping_cart import change_recipe_totals
 
 MIN_AMOUNT = 1
 MAX_AMOUNT = 32000
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32000
+MAX_BATCH_SIZE = 1000
+
+
+def resolve_ids(model, ids, duplicate_message, missing_message, field=None):
+    """Загружает объекты model по списку id одним запросом.
+
+    Повторы и несуществующие id собираются за один проход и возвращаются
+    ошибками по номеру элемента списка (и полю field элемента, если задано).
+    """
+    objects = model.objects.in_bulk(ids)
+    errors = {}
+    seen = set()
+    for index, pk in enumerate(ids):
+        if pk not in objects:
+            errors[index] = [missing_message]
+        elif pk in seen:
+            errors[index] = [duplicate_message]
+        seen.add(pk)
+        if field and index in errors:
+            errors[index] = {field: errors[index]}
+    if errors:
+        raise ValidationError(errors)
+    return objects
+
+
+def set_prefetched(instance, name, objects):
+    """Кладёт objects в кеш prefetch_related связи name у instance.
+
+    Объекты сортируются по -id, как при обычной выборке, чтобы ответ
+    после записи строился без повторных запросов.
+    """
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = sorted(
+        objects, key=lambda obj: obj.pk, reverse=True)
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault(
+        '_prefetched_objects_cache', {})[name] = queryset
 
 
 class Base64ImageField(serializers.ImageField):
@@ -25,23 +64,35 @@ class Base64ImageField(serializers.ImageField):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = decode_base64_image(
+                imgstr, 'temp.' + ext, format.split(':')[-1])
 
         return super().to_internal_value(data)
 
 
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """Адреса уменьшенных копий изображения в WebP и JPEG."""
+
+    def to_representation(self, value):
+        return get_rendition_urls(value, self.context.get('request'))
+
+
 class MyUserSerializer(UserSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField()
+    avatar_renditions = ImageRenditionsField(source='avatar')
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + (
             'is_subscribed',
             'avatar',
+            'avatar_renditions',
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         if user.is_authenticated:
             return user.subscriptions.filter(subscribed_to=obj).exists()
@@ -80,8 +131,7 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
 
 class AddIngredientSerializer(serializers.ModelSerializer):
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(
         min_value=MIN_AMOUNT,
         max_value=MAX_AMOUNT
@@ -92,15 +142,23 @@ class AddIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return recipe_cache.render(self.child, list(recipes))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
 
     ingredients = AddIngredientSerializer(
         many=True,
         write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        write_only=True)
     image = Base64ImageField()
+    image_renditions = ImageRenditionsField(source='image')
     author = MyUserSerializer(
         read_only=True,
         default=serializers.CurrentUserDefault(),
@@ -116,36 +174,40 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_renditions', 'text',
+                  'cooking_time', 'favorites_count', 'shopping_cart_count')
+        list_serializer_class = RecipeListSerializer
 
     def validate_ingredients(self, value):
-        ingredients = value
-        if not ingredients:
-            raise ValidationError(
-                {'ingredients': 'отсутствует ингредиент!'})
-        ingredients_set = set()
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, name=item['id'])
-            if ingredient in ingredients_set:
-                raise ValidationError(
-                    {'ingredients': 'Ингредиенты повторяются!'})
-            ingredients_set.add(ingredient)
+        if not value:
+            raise ValidationError('отсутствует ингредиент!')
+        ingredients = resolve_ids(
+            Ingredient,
+            [item['id'] for item in value],
+            duplicate_message='Ингредиенты повторяются!',
+            missing_message='Ингредиент не найден!',
+            field='id',
+        )
+        for item in value:
+            item['id'] = ingredients[item['id']]
         return value
 
     def validate_tags(self, value):
-        tags = value
-        if not tags:
-            raise ValidationError(
-                {'tags': 'отсутствует таг!'})
-        tags_set = set()
-        for tag in tags:
-            if tag in tags_set:
-                raise ValidationError(
-                    {'tags': 'Теги повторяются!'})
-            tags_set.add(tag)
-        return value
+        if not value:
+            raise ValidationError('отсутствует таг!')
+        tags = resolve_ids(
+            Tag,
+            value,
+            duplicate_message='Теги повторяются!',
+            missing_message='Тег не найден!',
+        )
+        return [tags[tag_id] for tag_id in value]
 
     def to_representation(self, instance):
+        return recipe_cache.render(self, [instance])[0]
+
+    def build_representation(self, instance):
+        """Представление рецепта в обход кеша."""
         representation = super().to_representation(instance)
         representation['ingredients'] = IngredientRecipeSerializer(
             instance.recipe_ingredients.all(), many=True).data
@@ -163,7 +225,42 @@ class RecipeSerializer(serializers.ModelSerializer):
             ))
         IngredientRecipe.objects.bulk_create(bulk_list)
         model.tags.set(tags)
-
+        set_prefetched(model, 'recipe_ingredients', bulk_list)
+        set_prefetched(model, 'tags', tags)
+
+    def update_ingredients(self, recipe, ingredients):
+        """Приводит состав рецепта к ingredients минимумом запросов."""
+        current = {
+            item.ingredient_id: item
+            for item in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        result, to_create, to_update = [], [], []
+        # Разница состава для итогов корзин, где лежит рецепт.
+        deltas = {}
+        for item in ingredients:
+            ingredient, amount = item['id'], item['amount']
+            row = current.pop(ingredient.pk, None)
+            if row is None:
+                row = IngredientRecipe(recipe=recipe, amount=amount)
+                to_create.append(row)
+                deltas[ingredient.pk] = amount
+            elif row.amount != amount:
+                deltas[ingredient.pk] = amount - row.amount
+                row.amount = amount
+                to_update.append(row)
+            row.ingredient = ingredient
+            result.append(row)
+        for item in current.values():
+            deltas[item.ingredient_id] = -item.amount
+        if current:
+            IngredientRecipe.objects.filter(
+                pk__in=[item.pk for item in current.values()]).delete()
+        IngredientRecipe.objects.bulk_update(to_update, ('amount',))
+        IngredientRecipe.objects.bulk_create(to_create)
+        change_recipe_totals(recipe.pk, deltas)
+        set_prefetched(recipe, 'recipe_ingredients', result)
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context['request'].user
         ingredients = validated_data.pop('ingredients')
@@ -173,6 +270,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.add_tags_ingredients(ingredients, tags, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         try:
             ingredients = validated_data.pop('ingredients')
@@ -182,37 +280,37 @@ class RecipeSerializer(serializers.ModelSerializer):
             tags = validated_data.pop('tags')
         except KeyError:
             raise ValidationError({'tags': 'Отсутствует ключ'})
-        instance.ingredients.clear()
-        self.add_tags_ingredients(ingredients, tags, instance)
+        self.update_ingredients(instance, ingredients)
+        instance.tags.set(tags)
+        set_prefetched(instance, 'tags', tags)
         return super().update(instance, validated_data)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if not user.is_anonymous:
             return obj.favorite.filter(user=user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if not user.is_anonymous:
             return obj.shopping_cart.filter(user=user).exists()
-        return True
+        return False
 
 
-class ShortLinkSerializer(serializers.HyperlinkedModelSerializer):
-    short_link = serializers.HyperlinkedIdentityField(
-        view_name='recipe-detail', lookup_field='pk'
-    )
+class ShortLinkSerializer(serializers.ModelSerializer):
 
     class Meta:
-        model = Recipe
-        fields = ('short_link',)
+        model = ShortLink
+        fields = ('code',)
 
     def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        url = representation.pop('short_link').replace('/api', '')
-        representation['short-link'] = url
-        return representation
+        url = reverse('short-link', args=(instance.code,))
+        return {'short-link': self.context['request'].build_absolute_uri(url)}
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -229,6 +327,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         model = Subscription
         fields = ('subscriber', 'subscribed_to',)
 
+    @transaction.atomic
     def create(self, validated_data):
         subscription = Subscription.objects.create(
             subscriber=self.context['request'].user,
@@ -238,8 +337,11 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return subscription
 
     def to_representation(self, instance):
+        author = instance.subscribed_to
+        author.is_subscribed = (
+            instance.subscriber_id == self.context['request'].user.pk)
         representation = SubUserSerializer(
-            instance.subscribed_to,
+            author,
             context=self.context).data
         return representation
 
@@ -254,31 +356,34 @@ class AvatarSerializer(serializers.ModelSerializer):
 
 
 class SubRecipeSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField(source='image')
+
     class Meta():
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
 
 
 class SubUserSerializer(MyUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta(MyUserSerializer.Meta):
         pagination_class = MyPageNumberPaginator
         fields = MyUserSerializer.Meta.fields + (
             'recipes_count',
+            'subscribers_count',
             'recipes',
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit and limit.isdigit():
-            recipes = recipes[:int(limit)]
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.pk, [])
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if limit and limit.isdigit():
+                recipes = recipes[:int(limit)]
         return SubRecipeSerializer(recipes, many=True).data
 
 
@@ -296,6 +401,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Favorite
         fields = ('user', 'recipe')
 
+    @transaction.atomic
     def create(self, validated_data):
 
         create_some_one = Favorite.objects.create(
@@ -327,6 +433,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         model = ShoppingCart
         fields = ('user', 'recipe')
 
+    @transaction.atomic
     def create(self, validated_data):
 
         create_some_one = ShoppingCart.objects.create(
@@ -342,3 +449,39 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             context=self.context).data
 
         return representation
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'status', 'attempts', 'created_at', 'updated_at',
+                  'download')
+
+    def get_download(self, obj):
+        if obj.status != Job.Status.DONE:
+            return None
+        return self.context['request'].build_absolute_uri(
+            reverse('recipe-shopping-cart-export-download',
+                    kwargs={'job_id': obj.pk}))
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного изменения избранного и корзины."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+
+
+class ShoppingCartTotalSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = ShoppingCartTotal
+        fields = ('name', 'measurement_unit', 'amount')
@@ -0,0 +1,56 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+def is_shared_cache(alias='default'):
+    """Кеш alias общий для процессов (Redis, Memcached, база данных).
+
+    LocMem видит только свой процесс: инвалидация в одном воркере не
+    доходит до остальных, и они отдают устаревшие данные.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def new_version():
+    return time.time_ns()
+
+
+def get_versions(keys):
+    """Версии по ключам keys; отсутствующие в кеше получают новую.
+
+    Новая, а не нулевая версия нужна, чтобы после вытеснения ключа
+    не подхватить данные, сохранённые под старой версией.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = new_version()
+            # add, а не set: при гонке двух воркеров версия будет одна.
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return versions
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+async def aget_version(key):
+    return await sync_to_async(get_version)(key)
+
+
+def bump_versions(keys):
+    """Обновляет версии keys после коммита текущей транзакции.
+
+    Новая версия, выданная до коммита, видна другим воркерам раньше
+    изменённых строк: они сохранили бы под ней старые данные.
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: cache.set_many(
+        {key: new_version() for key in keys}, None))
@@ -0,0 +1,88 @@
+import csv
+import json
+import tempfile
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Sum
+
+from recipes.models import ShoppingCartTotal
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Псевдо-буфер: csv.writer пишет в него и сразу получает строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_list(user):
+    """Суммарное количество ингредиентов из корзины user по имени.
+
+    user — пользователь или его id. Читаются готовые итоги корзины;
+    группировка по имени объединяет одноимённые ингредиенты каталога.
+    """
+    return (
+        ShoppingCartTotal.objects
+        .filter(user=user)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(total_amount=Sum('amount'))
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def render_txt(rows):
+    for row in rows:
+        yield (
+            f'{row["ingredient__name"]}:{row["total_amount"]}'
+            f'{row["ingredient__measurement_unit"]}.\n'
+        )
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in rows:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['total_amount'],
+            row['ingredient__measurement_unit'],
+        ))
+
+
+def render_json(rows):
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps({
+            'name': row['ingredient__name'],
+            'amount': row['total_amount'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json'),
+}
+
+
+def export_shopping_list(user_id, file_format):
+    """Фоновая задача: сохраняет список покупок в файл в хранилище."""
+    render, _ = SHOPPING_LIST_FORMATS[file_format]
+    with tempfile.TemporaryFile() as file:
+        for chunk in render(get_shopping_list(user_id)):
+            file.write(chunk.encode('utf-8'))
+        file.seek(0)
+        name = default_storage.save(
+            f'shopping_lists/{uuid.uuid4().hex}.{file_format}', File(file))
+    return {'file': name, 'format': file_format}
+
+
+EXPORT_TASK = f'{__name__}.{export_shopping_list.__name__}'
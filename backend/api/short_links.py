@@ -0,0 +1,105 @@
+import atexit
+import secrets
+import string
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from recipes.models import ShortLink
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 6
+CREATE_ATTEMPTS = 5
+
+
+def make_code(length=CODE_LENGTH):
+    """Случайный код из base62-алфавита."""
+    return ''.join(secrets.choice(ALPHABET) for _ in range(length))
+
+
+def get_short_link(recipe):
+    """Короткая ссылка рецепта; создаётся при первом запросе.
+
+    Повторяет попытку, если случайный код уже занят. Если ссылку
+    параллельно создал другой запрос, возвращает её.
+    """
+    for _ in range(CREATE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return ShortLink.objects.get_or_create(
+                    recipe=recipe, defaults={'code': make_code()})[0]
+        except IntegrityError:
+            continue
+    raise IntegrityError('Не удалось подобрать свободный код ссылки')
+
+
+@lru_cache(maxsize=settings.SHORT_LINK_CACHE_SIZE)
+def resolve(code):
+    """(id ссылки, id рецепта) по коду; ShortLink.DoesNotExist, если нет.
+
+    Исключения lru_cache не запоминает, поэтому несуществующие коды
+    не вытесняют из кеша настоящие.
+    """
+    return ShortLink.objects.values_list('pk', 'recipe_id').get(code=code)
+
+
+class HitCounter:
+    """Переходы по ссылкам, накопленные в памяти процесса.
+
+    Сбрасываются в базу одним UPDATE, когда накопилось
+    SHORT_LINK_FLUSH_HITS переходов или прошло SHORT_LINK_FLUSH_INTERVAL
+    секунд с прошлого сброса, а также при завершении процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def add(self, link_id):
+        with self._lock:
+            self._hits[link_id] += 1
+            self._pending += 1
+            due = (
+                self._pending >= settings.SHORT_LINK_FLUSH_HITS
+                or time.monotonic() - self._flushed_at
+                >= settings.SHORT_LINK_FLUSH_INTERVAL
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+            self._pending = 0
+            self._flushed_at = time.monotonic()
+        if not hits:
+            return
+        try:
+            ShortLink.objects.filter(pk__in=hits).update(
+                hits=F('hits') + Case(
+                    *(When(pk=link_id, then=Value(count))
+                      for link_id, count in hits.items()),
+                    default=Value(0),
+                ))
+        except DatabaseError:
+            # Переходы не теряются: вернутся в следующий сброс.
+            with self._lock:
+                self._hits.update(hits)
+
+
+hit_counter = HitCounter()
+atexit.register(hit_counter.flush)
+
+
+@receiver(post_delete, sender=ShortLink)
+def forget_short_link(**kwargs):
+    resolve.cache_clear()
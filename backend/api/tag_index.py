@@ -0,0 +1,62 @@
+import threading
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Tag
+from .shared_cache import bump_versions, get_version
+
+VERSION_CACHE_KEY = 'tag-index-version'
+
+
+class TagIndex:
+    """Соответствие слагов тегов их id в памяти процесса.
+
+    Тегов единицы, поэтому таблица читается целиком и перечитывается,
+    только когда сигналы на изменение Tag обновляют версию в кеше.
+    Версия меняется после коммита, иначе воркер, перечитавший таблицу
+    в это время, запомнил бы старые теги под новой версией.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._ids = {}
+
+    def _ensure_loaded(self):
+        version = get_version(VERSION_CACHE_KEY)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._ids = dict(Tag.objects.values_list('slug', 'pk'))
+                self._version = version
+
+    def choices(self):
+        self._ensure_loaded()
+        return [(slug, slug) for slug in self._ids]
+
+    def get(self, slug):
+        """id тега по слагу или None."""
+        self._ensure_loaded()
+        return self._ids.get(slug)
+
+    def ids(self, slugs):
+        self._ensure_loaded()
+        return [self._ids[slug] for slug in slugs if slug in self._ids]
+
+    def invalidate(self):
+        bump_versions([VERSION_CACHE_KEY])
+
+
+tag_index = TagIndex()
+
+
+def tag_choices():
+    return tag_index.choices()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_index(**kwargs):
+    tag_index.invalidate()
@@ -0,0 +1,23 @@
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from recipes.models import Tag
+
+
+class CatalogEtagTest(APITestCase):
+    """Версия каталога в ETag меняется только после коммита."""
+
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name='Обед', slug='lunch')
+
+    def test_etag_changes_after_commit(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', slug='dinner')
+            # Ответ, собранный до коммита, не получает новую версию:
+            # другие воркеры в это время ещё видят старый список.
+            self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
@@ -0,0 +1,58 @@
+import base64
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.images import run_make_renditions
+from recipes.models import Recipe
+from users.models import MyUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    'GA60e6kgAAAABJRU5ErkJggg==')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_RENDITION_WORKERS=0)
+class ImageTest(APITestCase):
+    """Копии изображений и ограничение размера тела запроса."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.author = MyUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов', password='Pa55-word')
+
+    def test_renditions_after_they_are_made(self):
+        # Без коммита копии не создаются: пул потоков ещё не закончил.
+        recipe = Recipe.objects.create(
+            author=self.author, name='Борщ', text='Сварить бульон.',
+            cooking_time=30, image=ContentFile(PNG, 'image.png'))
+        url = f'/api/recipes/{recipe.pk}/'
+        response = self.client.get(url)
+        self.assertIsNone(response.data['image_renditions'])
+        run_make_renditions(recipe.image.name,
+                            Recipe.objects.filter(pk=recipe.pk))
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(set(fresh.data['image_renditions']),
+                         {'thumbnail', 'card', 'full'})
+
+    @override_settings(JSON_MAX_BODY_SIZE=1024)
+    def test_body_too_large(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + (
+            Token.objects.create(user=self.author).key))
+        response = self.client.post(
+            '/api/recipes/', {'image': 'x' * 2048}, format='json')
+        self.assertEqual(response.status_code, 413)
+        response = self.client.post(
+            '/api/recipes/', {'image': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from api import ingredient_index, tag_index
+from api.shared_cache import get_version
+from recipes.models import Ingredient, Tag
+
+
+class TagIndexTest(APITestCase):
+    """Индекс тегов перечитывается после коммита изменений."""
+
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name='Обед', slug='lunch')
+
+    def test_new_slug_after_commit(self):
+        self.assertEqual(self.client.get(
+            '/api/recipes/', {'tags': 'lunch'}).status_code, 200)
+        version = get_version(tag_index.VERSION_CACHE_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', slug='dinner')
+            self.assertEqual(
+                get_version(tag_index.VERSION_CACHE_KEY), version)
+        self.assertNotEqual(
+            get_version(tag_index.VERSION_CACHE_KEY), version)
+        self.assertEqual(self.client.get(
+            '/api/recipes/', {'tags': 'dinner'}).status_code, 200)
+
+
+class IngredientIndexTest(APITestCase):
+    """Индекс ингредиентов перечитывается после коммита изменений."""
+
+    def setUp(self):
+        cache.clear()
+        Ingredient.objects.create(name='Картофель', measurement_unit='г')
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_new_ingredient_after_commit(self):
+        self.assertEqual(self.search('карт'), ['Картофель'])
+        key = ingredient_index.VERSION_CACHE_KEY
+        version = get_version(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Капуста', measurement_unit='г')
+            self.assertEqual(get_version(key), version)
+        self.assertNotEqual(get_version(key), version)
+        self.assertEqual(self.search('ка'), ['Капуста', 'Картофель'])
@@ -0,0 +1,184 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import MyUser, Subscription
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PNG = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFc'
+       'SJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+PASSWORD = 'Pa55-word'
+
+
+# Транзакционный тест: обработчики on_commit выполняются внутри запроса,
+# как в работающем приложении, и попадают в подсчёт.
+@override_settings(QUERY_BUDGET_MODE='raise', MEDIA_ROOT=MEDIA_ROOT,
+                   IMAGE_RENDITION_WORKERS=0)
+class QueryBudgetTest(APITransactionTestCase):
+    """Каждое представление с бюджетом укладывается в него.
+
+    Middleware в режиме raise бросает QueryBudgetExceeded, и тест падает.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.author, self.other = (
+            MyUser.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password=PASSWORD)
+            for name in ('user', 'author', 'other'))
+        self.admin = MyUser.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            first_name='admin', last_name='admin', password=PASSWORD)
+        self.tags = [Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}')
+                     for i in range(3)]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(10)]
+        self.anonymous = APIClient()
+        self.client = self.client_for(self.user)
+        self.author_client = self.client_for(self.author)
+        for i in range(5):
+            self.call(self.author_client, 'post', '/api/recipes/', 201,
+                      self.recipe_data(f'Рецепт {i}', i + 1))
+        self.recipe = Recipe.objects.filter(author=self.author).first()
+        Subscription.objects.create(subscriber=self.user,
+                                    subscribed_to=self.author)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + (
+            Token.objects.create(user=user).key))
+        return client
+
+    def recipe_data(self, name, size):
+        return {
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PNG,
+            'tags': [tag.pk for tag in self.tags[:2]],
+            'ingredients': [{'id': ingredient.pk, 'amount': 5}
+                            for ingredient in self.ingredients[:size]],
+        }
+
+    def call(self, client, method, url, status, data=None):
+        response = getattr(client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status,
+                         '' if response.streaming else response.content)
+        return response
+
+    def check(self, client, method, url, status, data=None):
+        """Запрос к представлению, у которого должен быть бюджет."""
+        response = self.call(client, method, url, status, data)
+        self.assertIsNotNone(response.wsgi_request.query_budget,
+                             f'{method.upper()} {url}: бюджет не задан')
+        return response
+
+    def test_catalog(self):
+        ingredient = self.ingredients[0].pk
+        tag = self.tags[0].pk
+        for url in ('/api/ingredients/', '/api/ingredients/?name=инг',
+                    f'/api/ingredients/{ingredient}/', '/api/tags/',
+                    f'/api/tags/{tag}/'):
+            with self.subTest(url=url):
+                self.check(self.anonymous, 'get', url, 200)
+
+    def test_recipes_read(self):
+        urls = ('/api/recipes/',
+                f'/api/recipes/?tags=tag-0&author={self.author.pk}',
+                '/api/recipes/?search=рецепт',
+                f'/api/recipes/{self.recipe.pk}/')
+        for client, url in (
+                *((self.anonymous, url) for url in urls),
+                *((self.client, url) for url in urls),
+                (self.client,
+                 '/api/recipes/?is_favorited=1&is_in_shopping_cart=1')):
+            with self.subTest(client=client, url=url):
+                cache.clear()
+                self.check(client, 'get', url, 200)
+
+    def test_recipes_write(self):
+        response = self.check(self.author_client, 'post', '/api/recipes/',
+                              201, self.recipe_data('Новый', 5))
+        url = f'/api/recipes/{response.data["id"]}/'
+        self.check(self.author_client, 'put', url, 200,
+                   self.recipe_data('Изменённый', 3))
+        self.check(self.author_client, 'patch', url, 200, {
+            'ingredients': [{'id': ingredient.pk, 'amount': 7}
+                            for ingredient in self.ingredients[2:8]],
+            'tags': [self.tags[2].pk],
+        })
+        self.check(self.author_client, 'delete', url, 204)
+
+    def test_recipe_lists(self):
+        recipe = Recipe.objects.filter(author=self.author).last().pk
+        for name in ('favorite', 'shopping_cart'):
+            with self.subTest(name=name):
+                url = f'/api/recipes/{recipe}/{name}/'
+                self.check(self.client, 'post', url, 201)
+                self.check(self.client, 'delete', url, 204)
+
+    def test_recipe_lists_batch(self):
+        recipes = {'recipes': list(
+            Recipe.objects.values_list('pk', flat=True))}
+        for name in ('favorite', 'shopping_cart'):
+            with self.subTest(name=name):
+                url = f'/api/recipes/{name}/'
+                self.check(self.client, 'post', url, 200, recipes)
+                self.check(self.client, 'delete', url, 200, recipes)
+        self.check(self.client, 'post', '/api/recipes/shopping_cart/',
+                   200, recipes)
+        self.check(self.client, 'get', '/api/recipes/shopping_cart/', 200)
+        self.check(self.client, 'get',
+                   '/api/recipes/download_shopping_cart/', 200)
+
+    def test_recipe_extras(self):
+        url = f'/api/recipes/{self.recipe.pk}/get-link/'
+        self.check(self.client, 'get', url, 200)
+        self.check(self.client, 'get', url, 200)
+        self.check(self.client, 'get', '/api/recipes/feed/?limit=2', 200)
+        admin = self.client_for(self.admin)
+        self.check(admin, 'get', '/api/recipes/export/', 200)
+        self.check(admin, 'get', '/api/metrics', 200)
+
+    def test_users(self):
+        for client in (self.anonymous, self.client):
+            with self.subTest(client=client):
+                self.check(client, 'get', '/api/users/', 200)
+                self.check(client, 'get', f'/api/users/{self.author.pk}/',
+                           200)
+        self.check(self.client, 'get',
+                   '/api/users/subscriptions/?recipes_limit=2', 200)
+        url = f'/api/users/{self.author.pk}/subscribe/?recipes_limit=2'
+        other = self.client_for(self.other)
+        self.check(other, 'post', url, 201)
+        self.check(other, 'delete', url, 204)
+
+    def test_me(self):
+        self.check(self.client, 'get', '/api/users/me/', 200)
+        self.check(self.client, 'put', '/api/users/me/', 200, {
+            'email': 'user@example.com', 'username': 'user',
+            'first_name': 'Имя', 'last_name': 'Фамилия', 'avatar': PNG})
+        self.check(self.client, 'patch', '/api/users/me/', 200,
+                   {'first_name': 'Другое'})
+        self.check(self.client, 'put', '/api/users/me/avatar/', 200,
+                   {'avatar': PNG})
+        self.check(self.client, 'delete', '/api/users/me/avatar/', 204)
+        # Автор с рецептами, подписчиком и рецептом в избранном и корзине.
+        self.check(self.author_client, 'delete', '/api/users/me/', 204,
+                   {'current_password': PASSWORD})
@@ -0,0 +1,69 @@
+import base64
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api import recipe_cache
+from api.serializer import RecipeSerializer
+from recipes.models import Recipe
+from users.models import MyUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CACHE_DIR = tempfile.mkdtemp()
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    'GA60e6kgAAAABJRU5ErkJggg==')
+
+
+# Кеш рецептов работает только с общим кешем, файловый — общий.
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_RENDITION_WORKERS=0, CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    },
+})
+class RecipeCacheTest(APITestCase):
+    """Версии кеша рецептов меняются только после коммита."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        author = MyUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов', password='Pa55-word')
+        self.recipe = Recipe.objects.create(
+            author=author, name='Борщ', text='Сварить бульон.',
+            cooking_time=30, image=ContentFile(PNG, 'image.png'))
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def render_in_other_worker(self, recipe):
+        """Представление, как его построит другой воркер."""
+        request = APIRequestFactory().get(self.url)
+        request.user = AnonymousUser()
+        return RecipeSerializer(recipe, context={'request': request}).data
+
+    def test_cached(self):
+        hits = recipe_cache.stats.hits
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(recipe_cache.stats.hits, hits + 1)
+
+    def test_get_before_commit_does_not_pin_stale_entry(self):
+        # Строка в том виде, в каком её видят другие воркеры до коммита.
+        committed = Recipe.objects.get(pk=self.recipe.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Щи'
+            self.recipe.save()
+            self.assertEqual(
+                self.render_in_other_worker(committed)['name'], 'Борщ')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Щи')
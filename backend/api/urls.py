@@ -1,8 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (IngredientViewSet, RecipeViewSet,
-                    TagViewSet, MyUserViewSet)
+                    TagViewSet, MyUserViewSet, metrics_view)
 
 router = DefaultRouter()
 router.register(r'users', MyUserViewSet, basename='user')
@@ -12,5 +13,11 @@ router.register(r'recipes', RecipeViewSet, basename='recipe')
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics', metrics_view, name='metrics'),
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_VIEWS:
+    from .async_views import urlpatterns as async_urlpatterns
+
+    urlpatterns = async_urlpatterns + urlpatterns
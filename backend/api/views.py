@@ -1,50 +1,137 @@
-from io import BytesIO
+from collections import defaultdict
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.core.files.storage import default_storage
+from django.db.models import Exists, OuterRef
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseRedirect, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import mixins, status, viewsets
-from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from jobs.models import Job
+from recipes.feed import recipe_ids as feed_recipe_ids
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShortLink, Tag)
 from users.models import Subscription, MyUser
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import MyPageNumberPaginator
+from . import recipe_cache, short_links
+from .conditional import (CatalogConditionalMixin, catalog_response,
+                          conditional_response, recipes_etag)
+from .filters import RecipeFilter, RecipeOrderingFilter
+from .ingredient_index import ingredient_index
+from .instrumentation import metrics
+from .negotiation import IgnoreClientContentNegotiation
+from .pagination import FeedPaginator, MyPageNumberPaginator
 from .permissions import OwnerOrReadOnly
-from .serializer import (FavoriteSerializer, IngredientSerializer,
+from .recipe_lists import add_recipes, remove_recipes
+from .recipe_transfer import CONTENT_TYPE, RecipeImporter, export_recipes
+from .serializer import (ExportJobSerializer, FavoriteSerializer,
+                         IngredientSerializer, RecipeIdsSerializer,
                          RecipeSerializer, ShoppingCartSerializer,
-                         ShortLinkSerializer, TagSerializer,
-                         AvatarSerializer, SubscriptionSerializer)
+                         ShoppingCartTotalSerializer, ShortLinkSerializer,
+                         TagSerializer, AvatarSerializer,
+                         SubscriptionSerializer)
+from .short_links import get_short_link
+from .shopping_list import (EXPORT_TASK, SHOPPING_LIST_FORMATS,
+                            export_shopping_list, get_shopping_list)
 
 
-class IngredientViewSet(mixins.ListModelMixin,
+class IngredientViewSet(CatalogConditionalMixin,
+                        mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
                         viewsets.GenericViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter, )
-    search_fields = ('^name',)
+    query_budgets = {'list': 2, 'retrieve': 2}
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        fuzzy = request.query_params.get('fuzzy', '').lower() in (
+            '1', 'true')
+        return catalog_response(request, lambda: Response(
+            self.get_serializer(
+                ingredient_index.lookup(name, fuzzy), many=True).data))
 
-class TagViewSet(mixins.ListModelMixin,
+
+class TagViewSet(CatalogConditionalMixin,
+                 mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  viewsets.GenericViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (OwnerOrReadOnly,)
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     pagination_class = MyPageNumberPaginator
     filterset_class = RecipeFilter
+    ordering_fields = ('id', 'pub_date', 'favorites_count',
+                       'shopping_cart_count')
     serializer_class = RecipeSerializer
+    # Измерены CaptureQueriesContext на холодном кеше (см.
+    # api/tests/test_query_budget.py), с запасом на проверку токена
+    # и промахи кеша представлений.
+    query_budgets = {
+        'list': 9,
+        'retrieve': 8,
+        'create': 20,
+        'update': 24,
+        'partial_update': 24,
+        'destroy': 20,
+        'favorite_change': {'post': 10, 'delete': 8},
+        'shopping_carg_change': {'post': 12, 'delete': 10},
+        'favorite_batch': {'post': 6, 'delete': 6},
+        'shopping_cart_batch': {'post': 8, 'delete': 8},
+        'shopping_cart_totals': 3,
+        'download_shopping_cart': 2,
+        'getlink': 10,
+        'export': 2,
+        'feed': 10,
+    }
+
+    def get_queryset(self):
+        return Recipe.objects.with_user_flags(
+            self.request.user).defer('search_vector')
+
+    def list(self, request, *args, **kwargs):
+        # ETag считается по строкам страницы до сериализации: при 304
+        # рецепты не рендерятся и не читаются из кеша представлений.
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        etag = recipes_etag(
+            request, page, *self.paginator.get_etag_parts())
+        return conditional_response(
+            request, etag, None,
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data),
+            personalised=True)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return conditional_response(
+            request, recipes_etag(request, [instance]), None,
+            lambda: Response(self.get_serializer(instance).data),
+            personalised=True)
+
+    def update(self, request, *args, **kwargs):
+        # В отличие от UpdateModelMixin не сбрасываем кеш prefetch_related:
+        # RecipeSerializer.update сам заполняет его актуальным составом.
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(
+            self.get_object(), data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
 
     @action(detail=True,
             methods=['post', 'delete'],
@@ -68,10 +155,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if not user.favorite.filter(recipe=recipe).exists():
+        if not remove_recipes(Favorite, user, [recipe.pk]):
             return Response({'errors': 'Объект не найден'},
                             status=status.HTTP_404_NOT_FOUND)
-        Favorite.objects.get(recipe=recipe).delete()
         return Response('Рецепт успешно удалён из избранного.',
                         status=status.HTTP_204_NO_CONTENT)
 
@@ -97,61 +183,228 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if not user.shopping_cart.filter(recipe=recipe).exists():
+        if not remove_recipes(ShoppingCart, user, [recipe.pk]):
             return Response({'errors': 'Объект не найден'},
                             status=status.HTTP_404_NOT_FOUND)
-        ShoppingCart.objects.get(recipe=recipe).delete()
         return Response('Рецепт успешно удалён из избранного.',
                         status=status.HTTP_204_NO_CONTENT)
 
+    def change_recipe_list(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            return Response(
+                {'added': add_recipes(model, request.user, recipe_ids)})
+        return Response(
+            {'removed': remove_recipes(model, request.user, recipe_ids)})
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated],
+            url_path='favorite')
+    def favorite_batch(self, request):
+        return self.change_recipe_list(request, Favorite)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated],
+            url_path='shopping_cart')
+    def shopping_cart_batch(self, request):
+        return self.change_recipe_list(request, ShoppingCart)
+
+    @shopping_cart_batch.mapping.get
+    def shopping_cart_totals(self, request):
+        totals = (
+            request.user.shopping_cart_totals
+            .select_related('ingredient')
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
+        )
+        return Response(
+            ShoppingCartTotalSerializer(totals, many=True).data)
+
     @action(['get'],
             detail=False,
             permission_classes=[IsAuthenticated],
+            content_negotiation_class=IgnoreClientContentNegotiation,
             url_path='download_shopping_cart')
     def download_shopping_cart(self, request):
-
-        recipe_ids = request.user.shopping_cart.all().values_list(
-            'recipe',
-            flat=True
+        file_format = self.get_shopping_list_format()
+        render, content_type = SHOPPING_LIST_FORMATS[file_format]
+        return StreamingHttpResponse(
+            render(get_shopping_list(request.user)),
+            content_type=content_type,
+            headers={
+                'Content-Disposition':
+                    f'attachment; filename="shopping_list.{file_format}"'
+            }
         )
 
-        queryset = (
-            IngredientRecipe.objects
-            .filter(recipe_id__in=recipe_ids)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-        )
+    def get_shopping_list_format(self):
+        file_format = self.request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise ValidationError({
+                'format': f'Доступные форматы: '
+                          f'{", ".join(SHOPPING_LIST_FORMATS)}.'
+            })
+        return file_format
 
-        buffer = BytesIO()
+    @action(['post'],
+            detail=False,
+            permission_classes=[IsAuthenticated],
+            content_negotiation_class=IgnoreClientContentNegotiation,
+            url_path='shopping_cart_export')
+    def shopping_cart_export(self, request):
+        job = Job.objects.enqueue(
+            export_shopping_list,
+            user_id=request.user.pk,
+            file_format=self.get_shopping_list_format(),
+        )
+        serializer = ExportJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    def get_export_job(self, job_id):
+        return get_object_or_404(
+            Job,
+            pk=job_id,
+            task=EXPORT_TASK,
+            payload__user_id=self.request.user.pk,
+        )
 
-        for result in queryset:
-            ingredient = result['ingredient__name']
-            total_amount = result['total_amount']
-            measurment_unit = result['ingredient__measurement_unit']
-            buffer.write(
-                f'{ingredient}:{total_amount}'
-                f'{measurment_unit}.\n'.encode('utf-8')
-            )
+    @action(['get'],
+            detail=False,
+            permission_classes=[IsAuthenticated],
+            url_path=r'shopping_cart_export/(?P<job_id>\d+)')
+    def shopping_cart_export_status(self, request, job_id=None):
+        serializer = ExportJobSerializer(
+            self.get_export_job(job_id), context={'request': request})
+        return Response(serializer.data)
 
-        buffer.seek(0)
-        response = FileResponse(
-            buffer,
+    @action(['get'],
+            detail=False,
+            permission_classes=[IsAuthenticated],
+            url_path=r'shopping_cart_export/(?P<job_id>\d+)/download')
+    def shopping_cart_export_download(self, request, job_id=None):
+        job = self.get_export_job(job_id)
+        if job.status != Job.Status.DONE:
+            return Response({'errors': 'Файл ещё не готов.'},
+                            status=status.HTTP_409_CONFLICT)
+        file_format = job.result['format']
+        return FileResponse(
+            default_storage.open(job.result['file']),
             as_attachment=True,
-            content_type='text/plain',
-            filename='shopping_list.txt'
+            content_type=SHOPPING_LIST_FORMATS[file_format][1],
+            filename=f'shopping_list.{file_format}'
         )
-        return response
+
+    @action(['get'],
+            detail=False,
+            permission_classes=[IsAuthenticated],
+            url_path='feed')
+    def feed(self, request):
+        paginator = FeedPaginator()
+        ids = paginator.paginate_ids(
+            lambda before, limit: feed_recipe_ids(request.user, before, limit),
+            request)
+        page = list(self.get_queryset().filter(pk__in=ids))
+        return conditional_response(
+            request, recipes_etag(request, page, paginator.get_next_link()),
+            None,
+            lambda: paginator.get_paginated_response(
+                self.get_serializer(page, many=True).data),
+            personalised=True)
+
+    @action(['get'],
+            detail=False,
+            permission_classes=[IsAdminUser],
+            url_path='cache_stats')
+    def cache_stats(self, request):
+        return Response(recipe_cache.stats.as_dict())
+
+    @action(['get'],
+            detail=False,
+            permission_classes=[IsAdminUser],
+            content_negotiation_class=IgnoreClientContentNegotiation,
+            url_path='export')
+    def export(self, request):
+        recipes = Recipe.objects.all()
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            parsed = parse_datetime(updated_since)
+            if parsed is None:
+                raise ValidationError(
+                    {'updated_since': 'Ожидается дата и время ISO 8601.'})
+            recipes = recipes.filter(updated_at__gte=parsed)
+        return StreamingHttpResponse(
+            export_recipes(recipes, request),
+            content_type=CONTENT_TYPE)
+
+    @action(['post'],
+            detail=False,
+            permission_classes=[IsAdminUser],
+            url_path='import')
+    def import_recipes(self, request):
+        # Тело читается построчно, не целиком, поэтому request.data
+        # и парсеры не используются.
+        result = RecipeImporter(request.user).run(request.stream or ())
+        return Response(result)
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def getlink(self, request, pk=None):
         recipe = get_object_or_404(Recipe, pk=pk)
-        serializer = ShortLinkSerializer(recipe, context={'request': request})
+        serializer = ShortLinkSerializer(
+            get_short_link(recipe), context={'request': request})
         return Response(serializer.data)
 
 
+def short_link_redirect(request, code):
+    """Переход по короткой ссылке на страницу рецепта.
+
+    Код ищется в LRU-кеше процесса, переход учитывается в памяти.
+    Редирект временный, чтобы браузеры не запоминали его мимо счётчика.
+    """
+    try:
+        link_id, recipe_id = short_links.resolve(code)
+    except ShortLink.DoesNotExist:
+        raise Http404
+    short_links.hit_counter.add(link_id)
+    return HttpResponseRedirect(f'/recipes/{recipe_id}')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Метрики маршрутов процесса в текстовом формате Prometheus."""
+    return HttpResponse(metrics.exposition(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
+
+
+metrics_view.query_budget = 2
+
+
 class MyUserViewSet(UserViewSet):
 
     pagination_class = MyPageNumberPaginator
+    query_budgets = {
+        'list': 4,
+        'retrieve': 3,
+        # Удаление пользователя — каскад по его рецептам, спискам
+        # и подпискам; на SQLite ещё запрос к FTS5 на каждый рецепт.
+        'me': {'get': 3, 'put': 8, 'patch': 8, 'delete': 40},
+        'upload_avatar': {'put': 6, 'delete': 6},
+        'subscribed': 6,
+        'subscribe_change': {'post': 12, 'delete': 10},
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    subscriber=user, subscribed_to=OuterRef('pk'))))
+        return queryset
 
     @action(['get', 'put', 'patch', 'delete'],
             detail=False,
@@ -198,14 +451,30 @@ class MyUserViewSet(UserViewSet):
             permission_classes=[IsAuthenticated]
             )
     def subscribed(self, request, *args, **kwargs):
-        queryset = request.user.subscriptions.all()
+        queryset = request.user.subscriptions.select_related('subscribed_to')
         page = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             page,
-            context={'request': request},
+            context=self.get_subscription_context(
+                subscription.subscribed_to_id for subscription in page),
             many=True)
         return self.get_paginated_response(serializer.data)
 
+    def get_subscription_context(self, author_ids):
+        """Контекст SubscriptionSerializer с рецептами авторов из одного
+        запроса вместо запроса на каждого автора."""
+        recipes = Recipe.objects.filter(author__in=list(author_ids))
+        limit = self.request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.latest_per_author(int(limit))
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        return {
+            'request': self.request,
+            'recipes_by_author': recipes_by_author,
+        }
+
     @action(['post', 'delete'],
             detail=True,
             url_path='subscribe',
@@ -232,10 +501,13 @@ class MyUserViewSet(UserViewSet):
                     'subscriber': request.user.email,
                     'subscribed_to': subscribed_to.email
                 },
-                context={'request': request}
+                context=self.get_subscription_context([subscribed_to.pk])
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            # Счётчик подписчиков увеличил сигнал уже после того, как
+            # автор был прочитан при проверке данных.
+            serializer.save().subscribed_to.refresh_from_db(
+                fields=['subscribers_count'])
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -0,0 +1,37 @@
+from django.db.backends.postgresql import base, creation
+
+from .pool import close_pool, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Соединения из пула иначе не дадут удалить тестовую базу.
+        close_pool(self.connection.alias, test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Бэкенд PostgreSQL, берущий соединения из пула процесса.
+
+    Настройки пула — в ключе POOL базы: MAX_SIZE, TIMEOUT, CHECK.
+    При CONN_MAX_AGE=0 Django закрывает соединение в конце запроса,
+    и оно возвращается в пул вместо разрыва.
+    """
+
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict['NAME'],
+                        self.settings_dict.get('POOL', {}))
+
+    def get_new_connection(self, conn_params):
+        return self.pool.checkout(
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
@@ -0,0 +1,111 @@
+import collections
+import os
+import threading
+
+from psycopg2 import Error, OperationalError, extensions
+
+# Пулы текущего процесса по псевдониму и имени базы; pid в ключе
+# защищает от соединений, унаследованных после fork.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений psycopg2 одного процесса.
+
+    Одновременно выдаётся не больше max_size соединений, остальные
+    ждут до timeout секунд. При выдаче соединение из пула проверяется
+    запросом SELECT 1, если включена проверка check.
+    """
+
+    def __init__(self, max_size, timeout, check):
+        self.timeout = timeout
+        self.check = check
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def _is_usable(self, connection):
+        if connection.closed:
+            return False
+        if not self.check:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if (connection.info.transaction_status
+                    != extensions.TRANSACTION_STATUS_IDLE):
+                connection.rollback()
+            return True
+        except Error:
+            return False
+
+    def checkout(self, connect):
+        """Соединение из пула или новое, созданное вызовом connect()."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OperationalError(
+                'Пул соединений исчерпан: нет свободного соединения '
+                f'за {self.timeout} с')
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return connect()
+                if self._is_usable(connection):
+                    return connection
+                close_quietly(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, connection):
+        """Возвращает соединение; незавершённая транзакция откатывается."""
+        try:
+            if connection.closed:
+                return
+            status = connection.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close_quietly(connection)
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            with self._lock:
+                self._idle.append(connection)
+        except Error:
+            close_quietly(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+        for connection in idle:
+            close_quietly(connection)
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Error:
+        pass
+
+
+def get_pool(alias, name, options):
+    key = (os.getpid(), alias, name)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 4),
+                timeout=options.get('TIMEOUT', 10),
+                check=options.get('CHECK', True),
+            )
+        return _pools[key]
+
+
+def close_pool(alias, name):
+    """Закрывает простаивающие соединения, например перед DROP DATABASE."""
+    with _pools_lock:
+        pool = _pools.pop((os.getpid(), alias, name), None)
+    if pool is not None:
+        pool.close()
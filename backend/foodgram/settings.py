@@ -19,6 +19,9 @@ def debug_check(debug):
 
 DEBUG = debug_check(os.getenv('DEBUG_MODE', True))
 
+# Асинхронные представления для частых запросов; включать под ASGI.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost, 127.0.0.1').split(', ')
 
 
@@ -29,16 +32,19 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
     'djoser',
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.query_budget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -77,12 +84,23 @@ AUTH_USER_MODEL = 'users.MyUser'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'foodgram.db'),
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        # Пул соединений бэкенда foodgram.db, свой в каждом процессе.
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'CHECK': os.getenv('DB_POOL_CHECK', 'True').lower() == 'true',
+        },
+        # PgBouncer в режиме transaction не сохраняет серверные курсоры
+        # между транзакциями.
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_PGBOUNCER', 'False').lower() == 'true'),
     }
 }
 
@@ -116,12 +134,54 @@ USE_I18N = True
 
 USE_TZ = True
 
+# Кеш, общий для всех процессов: представления рецептов, их версии
+# и версии ETag. Например, CACHE_BACKEND=
+# django.core.cache.backends.redis.RedisCache и
+# CACHE_LOCATION=redis://redis:6379/0. LocMem по умолчанию у каждого
+# процесса свой, поэтому кеш рецептов на нём выключен.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
+# Картинка в base64 на треть больше исходной, плюс остальные поля.
+JSON_MAX_BODY_SIZE = int(os.getenv(
+    'JSON_MAX_BODY_SIZE', IMAGE_MAX_UPLOAD_SIZE * 4 // 3 + 1024 * 1024))
+
+INGREDIENT_FUZZY_THRESHOLD = float(
+    os.getenv('INGREDIENT_FUZZY_THRESHOLD', 0.3))
+INGREDIENT_FUZZY_LIMIT = int(os.getenv('INGREDIENT_FUZZY_LIMIT', 10))
+
+# Реакция на превышение бюджета запросов представлений: off, log, raise.
+# По умолчанию off: синхронное middleware под ASGI добавляет переход
+# между потоками на каждый запрос.
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'off')
+
+# Функции, которые можно ставить в очередь фоновых задач (jobs).
+JOB_TASKS = (
+    'api.shopping_list.export_shopping_list',
+)
+# Через сколько дней завершённые задачи удаляются вместе с их файлами.
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+# Server-Timing и метрики маршрутов для /api/metrics.
+INSTRUMENTATION = os.getenv('INSTRUMENTATION', 'False').lower() == 'true'
+
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 4096))
+SHORT_LINK_FLUSH_HITS = int(os.getenv('SHORT_LINK_FLUSH_HITS', 100))
+SHORT_LINK_FLUSH_INTERVAL = int(os.getenv('SHORT_LINK_FLUSH_INTERVAL', 10))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
@@ -134,6 +194,12 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
 
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.LimitedJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
 }
 
 
@@ -150,6 +216,12 @@ DJOSER = {
     },
 }
 
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60))
+
+# Рецепты авторов с таким числом подписчиков и больше не раскладываются
+# по лентам при публикации, а подмешиваются в ленту при чтении.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
 CSRF_TRUSTED_ORIGINS = [
     'https://kittykittykitty.hopto.org',
 ]
@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'task',
+        'status',
+        'priority',
+        'attempts',
+        'run_at',
+        'updated_at'
+    )
+    list_filter = ('status', 'task')
+    # Задачу и аргументы задаёт только код через Job.objects.enqueue:
+    # из админки нельзя вызвать произвольную функцию.
+    readonly_fields = ('task', 'payload', 'locked_by', 'result', 'error')
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = ('Удаляет завершённые фоновые задачи старше --days дней '
+            'вместе с их файлами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.JOB_RETENTION_DAYS,
+            help='Срок хранения в днях (по умолчанию JOB_RETENTION_DAYS).')
+
+    def handle(self, *args, **options):
+        pruned = Job.objects.prune(
+            timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(f'Удалено задач: {pruned}')
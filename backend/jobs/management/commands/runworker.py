@@ -0,0 +1,52 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.worker import Worker
+
+
+def run_worker(poll_interval):
+    Worker(poll_interval).run()
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры очереди фоновых задач.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='Число процессов-воркеров.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи в текущем процессе и выйти.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            worker = Worker()
+            while worker.run_once():
+                pass
+            return
+        # Дочерние процессы не должны наследовать открытые соединения.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=run_worker, args=(options['poll_interval'],))
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def shutdown(*args):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+        self.stdout.write(f'Запущено воркеров: {len(processes)}')
+        for process in processes:
+            process.join()
@@ -0,0 +1,164 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+MAX_CHARFIELD_LENGHT = 150
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 10
+# Задача в статусе running дольше этого срока считается брошенной
+# упавшим воркером и снова выдаётся из очереди.
+RUNNING_TIMEOUT = timedelta(minutes=30)
+PRUNE_BATCH_SIZE = 1000
+
+
+class TaskNotAllowed(ValueError):
+    """Задачи нет в настройке JOB_TASKS."""
+
+
+def get_task(task):
+    """Функция задачи по полному пути, если он есть в JOB_TASKS."""
+    if task not in settings.JOB_TASKS:
+        raise TaskNotAllowed(f'Задачи {task} нет в JOB_TASKS.')
+    return import_string(task)
+
+
+class JobQuerySet(models.QuerySet):
+
+    def enqueue(self, task, priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                **payload):
+        """Ставит в очередь вызов task(**payload).
+
+        task — функция или её полный путь, разрешённый в JOB_TASKS.
+        """
+        if callable(task):
+            task = f'{task.__module__}.{task.__qualname__}'
+        get_task(task)
+        return self.create(task=task, payload=payload, priority=priority,
+                           max_attempts=max_attempts)
+
+    def dequeue(self, worker):
+        """Забирает следующую готовую задачу, не блокируясь на чужих.
+
+        SELECT ... FOR UPDATE SKIP LOCKED позволяет нескольким воркерам
+        разбирать очередь параллельно без двойного выполнения. Брошенные
+        задачи выдаются снова, пока у них остаются попытки, а без
+        попыток помечаются проваленными.
+        """
+        now = timezone.now()
+        stale = models.Q(status=Job.Status.RUNNING,
+                         updated_at__lt=now - RUNNING_TIMEOUT)
+        with transaction.atomic():
+            self.filter(stale, attempts__gte=models.F('max_attempts')).update(
+                status=Job.Status.FAILED,
+                error='Воркер не завершил задачу за RUNNING_TIMEOUT.',
+                updated_at=now,
+            )
+            job = (
+                self.select_for_update(skip_locked=True)
+                .filter(
+                    models.Q(status=Job.Status.QUEUED, run_at__lte=now)
+                    | stale & models.Q(attempts__lt=models.F('max_attempts'))
+                )
+                .order_by('-priority', 'run_at', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = Job.Status.RUNNING
+            job.attempts += 1
+            job.locked_by = worker
+            job.save(update_fields=(
+                'status', 'attempts', 'locked_by', 'updated_at'))
+        return job
+
+    def prune(self, before=None):
+        """Удаляет задачи, завершённые раньше before, и их файлы.
+
+        По умолчанию before — JOB_RETENTION_DAYS дней назад. Файлом
+        задачи считается result['file'] в хранилище по умолчанию.
+        Возвращает число удалённых задач.
+        """
+        if before is None:
+            before = timezone.now() - timedelta(
+                days=settings.JOB_RETENTION_DAYS)
+        finished = self.filter(
+            status__in=(Job.Status.DONE, Job.Status.FAILED),
+            updated_at__lt=before,
+        ).order_by('id')
+        pruned = 0
+        while batch := list(
+                finished.values_list('id', 'result')[:PRUNE_BATCH_SIZE]):
+            for _, result in batch:
+                if isinstance(result, dict) and result.get('file'):
+                    default_storage.delete(result['file'])
+            self.filter(id__in=[pk for pk, _ in batch]).delete()
+            pruned += len(batch)
+        return pruned
+
+
+class Job(models.Model):
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Выполнена'
+        FAILED = 'failed', 'Ошибка'
+
+    task = models.CharField(
+        'Задача', max_length=MAX_CHARFIELD_LENGHT)
+    payload = models.JSONField('Аргументы', default=dict)
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    status = models.CharField(
+        'Статус',
+        max_length=16,
+        choices=Status.choices,
+        default=Status.QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток', default=DEFAULT_MAX_ATTEMPTS)
+    run_at = models.DateTimeField('Запустить после', default=timezone.now)
+    locked_by = models.CharField(
+        'Воркер', max_length=MAX_CHARFIELD_LENGHT, blank=True)
+    result = models.JSONField('Результат', null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    updated_at = models.DateTimeField('Изменена', auto_now=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=['status', '-priority', 'run_at'],
+                name='job_dequeue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk} ({self.status})'
+
+    def mark_done(self, result):
+        self.status = self.Status.DONE
+        self.result = result
+        self.error = ''
+        self.save(update_fields=('status', 'result', 'error', 'updated_at'))
+
+    def mark_failed(self, error, retry=True):
+        """Возвращает задачу в очередь с экспоненциальной задержкой
+        или помечает проваленной, если попытки кончились или retry
+        ложно."""
+        self.error = error
+        if retry and self.attempts < self.max_attempts:
+            self.status = self.Status.QUEUED
+            self.run_at = timezone.now() + timedelta(
+                seconds=RETRY_BASE_DELAY * 2 ** (self.attempts - 1))
+        else:
+            self.status = self.Status.FAILED
+        self.save(update_fields=('status', 'run_at', 'error', 'updated_at'))
@@ -0,0 +1,47 @@
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+
+MEDIA_ROOT = tempfile.mkdtemp()
+TASK = 'api.shopping_list.export_shopping_list'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, JOB_RETENTION_DAYS=7)
+class PruneTest(TestCase):
+    """Завершённые задачи старше срока удаляются вместе с файлами."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_job(self, status, days, file=None):
+        result = None
+        if file is not None:
+            result = {'file': default_storage.save(
+                file, ContentFile(b'data')), 'format': 'txt'}
+        job = Job.objects.create(task=TASK, status=status, result=result)
+        Job.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - timedelta(days=days))
+        return job
+
+    def test_prune(self):
+        old = self.create_job(Job.Status.DONE, 8, 'shopping_lists/old.txt')
+        self.create_job(Job.Status.FAILED, 8)
+        recent = self.create_job(
+            Job.Status.DONE, 1, 'shopping_lists/recent.txt')
+        queued = self.create_job(Job.Status.QUEUED, 30)
+        running = self.create_job(Job.Status.RUNNING, 30)
+        self.assertEqual(Job.objects.prune(), 2)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)),
+                         {recent.pk, queued.pk, running.pk})
+        self.assertFalse(default_storage.exists(old.result['file']))
+        self.assertTrue(default_storage.exists(recent.result['file']))
+        self.assertEqual(Job.objects.prune(), 0)
@@ -0,0 +1,74 @@
+import logging
+import os
+import signal
+import socket
+import time
+import traceback
+
+from django.db import close_old_connections
+
+from .models import Job, TaskNotAllowed, get_task
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер удаляет устаревшие задачи, в секундах.
+PRUNE_INTERVAL = 60 * 60
+
+
+class Worker:
+    """Цикл выборки и выполнения задач в одном процессе."""
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopped = False
+        self.pruned_at = None
+
+    def stop(self, *args):
+        self.stopped = True
+
+    def run_once(self):
+        """Выполняет одну задачу; False, если очередь пуста."""
+        close_old_connections()
+        self.prune()
+        job = Job.objects.dequeue(self.name)
+        if job is None:
+            return False
+        try:
+            task = get_task(job.task)
+        except TaskNotAllowed as error:
+            # Повтор не поможет: задачу записали в обход enqueue.
+            logger.error('Задача %s не разрешена', job)
+            job.mark_failed(str(error), retry=False)
+            return True
+        try:
+            result = task(**job.payload)
+        except Exception:
+            logger.exception('Задача %s завершилась ошибкой', job)
+            job.mark_failed(traceback.format_exc())
+        else:
+            job.mark_done(result)
+        return True
+
+    def prune(self):
+        """Раз в PRUNE_INTERVAL удаляет устаревшие задачи и их файлы."""
+        now = time.monotonic()
+        if self.pruned_at is not None and (
+                now - self.pruned_at < PRUNE_INTERVAL):
+            return
+        self.pruned_at = now
+        pruned = Job.objects.prune()
+        if pruned:
+            logger.info('Удалено устаревших задач: %s', pruned)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        while not self.stopped:
+            try:
+                has_job = self.run_once()
+            except Exception:
+                logger.exception('Ошибка при выборке задачи')
+                has_job = False
+            if not has_job:
+                time.sleep(self.poll_interval)
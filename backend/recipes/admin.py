@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.db.models import Count
 
-from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .models import (Favorite, Ingredient, Recipe, ShoppingCart, ShortLink,
+                     Tag)
 
 admin.site.register(Tag)
 admin.site.register(Favorite)
@@ -13,21 +13,11 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'author_info',
         'tags_names',
-        'favorite_count'
+        'favorites_count'
     )
     search_fields = ('name', 'author_info')
     filter_horizontal = ('tags',)
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            favorite_count=Count('favorite')
-        )
-        return queryset
-
-    def favorite_count(self, obj):
-        return obj.favorite_count
-
 
 admin.site.register(Recipe, RecipeAdmin)
 
@@ -37,3 +27,12 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Ingredient)
+
+
+class ShortLinkAdmin(admin.ModelAdmin):
+    list_display = ('code', 'recipe', 'hits')
+    search_fields = ('code', 'recipe__name')
+    raw_id_fields = ('recipe',)
+
+
+admin.site.register(ShortLink, ShortLinkAdmin)
@@ -5,3 +5,7 @@ class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = 'Рецепты'
+
+    def ready(self):
+        # counters — первым: обработчики feed читают счётчик подписчиков.
+        from . import counters, feed, search, shopping_cart  # noqa: F401
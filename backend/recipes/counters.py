@@ -0,0 +1,76 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+
+from users.models import MyUser, Subscription
+from .models import Favorite, Recipe, ShoppingCart
+
+# (модель со счётчиком, поле счётчика, модель строк, внешний ключ на неё)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (MyUser, 'recipes_count', Recipe, 'author'),
+    (MyUser, 'subscribers_count', Subscription, 'subscribed_to'),
+)
+
+
+def count_expression(related_model, fk_name):
+    return Coalesce(Subquery(
+        related_model.objects
+        .filter(**{fk_name: OuterRef('pk')})
+        .order_by()
+        .values(fk_name)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), Value(0))
+
+
+def recount():
+    """Пересчитывает счётчики, исправляя только разошедшиеся строки.
+
+    Возвращает словарь {поле: число исправленных строк}.
+    """
+    repaired = {}
+    for model, field, related_model, fk_name in COUNTERS:
+        actual = count_expression(related_model, fk_name)
+        repaired[field] = (
+            model.objects
+            .annotate(actual=actual)
+            .exclude(**{field: F('actual')})
+            .update(**{field: actual})
+        )
+    return repaired
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """Меняет счётчик field на delta у всех строк pks одним запросом."""
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, Value(0))})
+
+
+def connect_counter(model, field, related_model, fk_name):
+    attname = related_model._meta.get_field(fk_name).attname
+
+    def increment(instance, created, raw, **kwargs):
+        if created and not raw:
+            change_counter(model, getattr(instance, attname), field, 1)
+
+    def decrement(instance, origin=None, **kwargs):
+        pk = getattr(instance, attname)
+        # Строка удаляется каскадом вместе с владельцем счётчика.
+        if isinstance(origin, model) and origin.pk == pk:
+            return
+        change_counter(model, pk, field, -1)
+
+    post_save.connect(increment, sender=related_model, weak=False,
+                      dispatch_uid=f'{field}_increment')
+    post_delete.connect(decrement, sender=related_model, weak=False,
+                        dispatch_uid=f'{field}_decrement')
+
+
+for counter in COUNTERS:
+    connect_counter(*counter)
@@ -0,0 +1,136 @@
+"""Ленты подписок: рецепты авторов, на которых подписан пользователь.
+
+Рецепт обычного автора при публикации раскладывается в FeedEntry всем
+его подписчикам, а при подписке в ленту добавляются все его рецепты.
+Авторов, у которых подписчиков не меньше FEED_FANOUT_LIMIT, такая
+раскладка заставила бы писать слишком много строк на каждый рецепт:
+их рецепты подмешиваются в ленту при чтении. Записи авторов, ставших
+популярными, при чтении пропускаются; rebuild() удаляет их и
+досоздаёт недостающие.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+
+from users.models import MyUser, Subscription
+from .models import FeedEntry, Recipe
+from .sql import insert_select, placeholders, table
+
+
+def insert(select):
+    """INSERT записей ленты из select (user_id, recipe_id, author_id)."""
+    return insert_select(FeedEntry, ('user', 'recipe', 'author'), select)
+
+
+def fan_out(recipe_ids):
+    """Раскладывает рецепты recipe_ids по лентам подписчиков авторов,
+    кроме популярных."""
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(insert(
+            f'SELECT s.subscriber_id, r.id, r.author_id '
+            f'FROM {table(Recipe)} r '
+            f'JOIN {table(MyUser)} u ON u.id = r.author_id '
+            f'JOIN {table(Subscription)} s '
+            f'ON s.subscribed_to_id = r.author_id '
+            f'WHERE r.id IN ({placeholders(recipe_ids)}) '
+            f'AND u.subscribers_count < %s'),
+            [*recipe_ids, settings.FEED_FANOUT_LIMIT])
+
+
+def fan_out_author(author_id, subscribers_count):
+    """Раскладывает все рецепты author_id по лентам его подписчиков,
+    если подписчиков у него ровно subscribers_count."""
+    with connection.cursor() as cursor:
+        cursor.execute(insert(
+            f'SELECT s.subscriber_id, r.id, r.author_id '
+            f'FROM {table(Subscription)} s '
+            f'JOIN {table(MyUser)} u ON u.id = s.subscribed_to_id '
+            f'JOIN {table(Recipe)} r ON r.author_id = u.id '
+            f'WHERE u.id = %s AND u.subscribers_count = %s'),
+            [author_id, subscribers_count])
+
+
+def recipe_ids(user, before=None, limit=None):
+    """Id рецептов ленты user по убыванию, меньшие before, не больше
+    limit."""
+    popular = list(
+        Subscription.objects
+        .filter(subscriber=user, subscribed_to__subscribers_count__gte=(
+            settings.FEED_FANOUT_LIMIT))
+        .values_list('subscribed_to', flat=True))
+    entries = (FeedEntry.objects.filter(user=user)
+               .exclude(author__in=popular).order_by('-recipe_id'))
+    direct = Recipe.objects.filter(author__in=popular).order_by('-id')
+    if before is not None:
+        entries = entries.filter(recipe__lt=before)
+        direct = direct.filter(pk__lt=before)
+    ids = list(entries.values_list('recipe', flat=True)[:limit])
+    if popular:
+        ids = sorted(ids + list(direct.values_list('pk', flat=True)[:limit]),
+                     reverse=True)[:limit]
+    return ids
+
+
+def rebuild():
+    """Приводит записи лент в соответствие с подписками и порогом.
+
+    Возвращает (удалено записей, добавлено записей).
+    """
+    feed = table(FeedEntry)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {feed} WHERE NOT EXISTS ('
+            f'SELECT 1 FROM {table(Subscription)} s '
+            f'JOIN {table(MyUser)} u ON u.id = s.subscribed_to_id '
+            f'WHERE s.subscriber_id = {feed}.user_id '
+            f'AND s.subscribed_to_id = {feed}.author_id '
+            f'AND u.subscribers_count < %s)', [settings.FEED_FANOUT_LIMIT])
+        removed = cursor.rowcount
+        cursor.execute(insert(
+            f'SELECT s.subscriber_id, r.id, r.author_id '
+            f'FROM {table(Subscription)} s '
+            f'JOIN {table(MyUser)} u ON u.id = s.subscribed_to_id '
+            f'JOIN {table(Recipe)} r ON r.author_id = u.id '
+            f'WHERE u.subscribers_count < %s'), [settings.FEED_FANOUT_LIMIT])
+        return removed, cursor.rowcount
+
+
+def publish(instance, created, raw, **kwargs):
+    if created and not raw:
+        fan_out([instance.pk])
+
+
+def subscribe(instance, created, raw, **kwargs):
+    # Счётчик подписчиков уже увеличен обработчиком из recipes.counters.
+    if created and not raw:
+        with connection.cursor() as cursor:
+            cursor.execute(insert(
+                f'SELECT %s, r.id, r.author_id '
+                f'FROM {table(Recipe)} r '
+                f'JOIN {table(MyUser)} u ON u.id = r.author_id '
+                f'WHERE u.id = %s AND u.subscribers_count < %s'),
+                [instance.subscriber_id, instance.subscribed_to_id,
+                 settings.FEED_FANOUT_LIMIT])
+
+
+def unsubscribe(instance, origin=None, **kwargs):
+    # Удаляется один из пользователей: его записи лент удалятся каскадом.
+    if isinstance(origin, MyUser) and origin.pk in (
+            instance.subscriber_id, instance.subscribed_to_id):
+        return
+    FeedEntry.objects.filter(
+        user=instance.subscriber_id, author=instance.subscribed_to_id,
+    ).delete()
+    # Если автор только что опустился ниже порога, рецептов, вышедших,
+    # пока он был популярен, в лентах нет.
+    fan_out_author(instance.subscribed_to_id,
+                   settings.FEED_FANOUT_LIMIT - 1)
+
+
+post_save.connect(publish, sender=Recipe, dispatch_uid='feed_publish')
+post_save.connect(subscribe, sender=Subscription,
+                  dispatch_uid='feed_subscribe')
+post_delete.connect(unsubscribe, sender=Subscription,
+                    dispatch_uid='feed_unsubscribe')
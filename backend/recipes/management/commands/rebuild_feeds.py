@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Заполняет ленты подписок по текущим подпискам и порогу '
+            'FEED_FANOUT_LIMIT, удаляя лишние записи.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            removed, added = rebuild()
+        self.stdout.write(
+            f'Удалено записей: {removed}, добавлено записей: {added}')
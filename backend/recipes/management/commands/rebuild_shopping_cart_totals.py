@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.shopping_cart import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Сверяет итоги списков покупок с корзинами и исправляет их.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            removed, added = rebuild()
+        self.stdout.write(
+            f'Удалено строк: {removed}, добавлено строк: {added}')
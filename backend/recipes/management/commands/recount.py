@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики рецептов и авторов.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            repaired = recount()
+        for field, rows in repaired.items():
+            self.stdout.write(f'{field}: исправлено строк {rows}')
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'shopping_cart_count', 'recipes.ShoppingCart',
+     'recipe'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, fk_name in COUNTERS:
+        related_model = apps.get_model(related_name)
+        apps.get_model(model_name).objects.update(**{
+            field: Coalesce(Subquery(
+                related_model.objects
+                .filter(**{fk_name: OuterRef('pk')})
+                .order_by()
+                .values(fk_name)
+                .annotate(total=Count('pk'))
+                .values('total')
+            ), Value(0))
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_alter_favorite_user_alter_ingredientrecipe_amount_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
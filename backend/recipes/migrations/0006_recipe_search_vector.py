@@ -0,0 +1,63 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:18
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INGREDIENTS = (
+    "SELECT string_agg(i.name, ' ') FROM recipes_ingredientrecipe ir "
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    'WHERE ir.recipe_id = r.id'
+)
+POSTGRESQL_FORWARD = (
+    'UPDATE recipes_recipe r SET search_vector = '
+    "setweight(to_tsvector('russian', r.name), 'A') || "
+    "setweight(to_tsvector('russian', "
+    f"COALESCE(({INGREDIENTS}), '')), 'B') || "
+    "setweight(to_tsvector('russian', r.text), 'C')",
+    'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+    'USING gin (search_vector)',
+)
+POSTGRESQL_BACKWARD = ('DROP INDEX IF EXISTS recipe_search_vector_idx',)
+
+
+def fold(column):
+    return f"REPLACE(REPLACE({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+    "name, ingredients, text, tokenize='unicode61 remove_diacritics 2')",
+    'INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) '
+    f"SELECT r.id, {fold('r.name')}, "
+    f"""{fold(f"COALESCE(({INGREDIENTS.replace('string_agg', 'group_concat')}), '')")}, """
+    f"{fold('r.text')} FROM recipes_recipe r",
+)
+SQLITE_BACKWARD = ('DROP TABLE IF EXISTS recipes_recipe_fts',)
+
+
+def run_for_vendor(postgresql, sqlite):
+    def run(apps, schema_editor):
+        statements = {'postgresql': postgresql, 'sqlite': sqlite}.get(
+            schema_editor.connection.vendor, ())
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRESQL_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRESQL_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
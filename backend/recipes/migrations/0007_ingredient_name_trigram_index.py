@@ -0,0 +1,32 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:31
+
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+    'ON recipes_ingredient USING gin (name gin_trgm_ops)',
+)
+POSTGRESQL_BACKWARD = ('DROP INDEX IF EXISTS ingredient_name_trgm_idx',)
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgresql(POSTGRESQL_FORWARD),
+            run_on_postgresql(POSTGRESQL_BACKWARD),
+        ),
+    ]
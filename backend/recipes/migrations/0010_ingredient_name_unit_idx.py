@@ -0,0 +1,18 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:38
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_shortlink'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(django.db.models.functions.text.Lower('name'), django.db.models.functions.text.Lower('measurement_unit'), name='ingredient_name_unit_idx'),
+        ),
+    ]
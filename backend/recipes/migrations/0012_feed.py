@@ -0,0 +1,82 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_feeds(apps, schema_editor):
+    Subscription = apps.get_model('users', 'Subscription')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    # Подписчиков считаем заново: на новой базе поле subscribers_count
+    # добавляется миграцией users, которая идёт позже этой.
+    popular = (
+        Subscription.objects
+        .order_by()
+        .values('subscribed_to')
+        .annotate(total=Count('pk'))
+        .filter(total__gte=settings.FEED_FANOUT_LIMIT)
+        .values('subscribed_to')
+    )
+    rows = (
+        Subscription.objects
+        .exclude(subscribed_to__in=popular)
+        .filter(subscribed_to__recipes__isnull=False)
+        .order_by()
+        .values_list('subscriber', 'subscribed_to__recipes', 'subscribed_to')
+    )
+    FeedEntry.objects.bulk_create((
+        FeedEntry(user_id=user, recipe_id=recipe, author_id=author)
+        for user, recipe, author in rows.iterator(chunk_size=5000)
+    ), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0011_shopping_cart_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'ordering': ['-recipe_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'author'], name='feed_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
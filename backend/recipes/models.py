@@ -1,5 +1,7 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models.functions import Lower, RowNumber
 
 from users.models import MyUser
 
@@ -8,6 +10,7 @@ MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32000
 MIN_INGREDIENT_AMONG = 1
 MAX_INGREDIENT_AMONG = 32000
+MAX_SHORT_LINK_CODE_LENGTH = 16
 
 
 class Ingredient(models.Model):
@@ -26,6 +29,10 @@ class Ingredient(models.Model):
         verbose_name = 'Ингридиент'
         verbose_name_plural = 'Ингридиенты'
         ordering = ['-id']
+        indexes = [
+            models.Index(Lower('name'), Lower('measurement_unit'),
+                         name='ingredient_name_unit_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -48,6 +55,31 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты флагами избранного и корзины для user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+    def latest_per_author(self, limit):
+        """Не более limit последних рецептов каждого автора одним запросом."""
+        return self.annotate(row_number=models.Window(
+            RowNumber(),
+            partition_by=models.F('author'),
+            order_by=models.F('id').desc(),
+        )).filter(row_number__lte=limit)
+
+
 class Recipe(models.Model):
 
     author = models.ForeignKey(
@@ -96,6 +128,23 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False)
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False)
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     def author_info(self):
         return f'{self.author.first_name} {self.author.last_name}'
@@ -112,6 +161,11 @@ class Recipe(models.Model):
             models.UniqueConstraint(
                 fields=['name', 'author'],
                 name='unique_recipe')]
+        indexes = [
+            # Последние рецепты автора: лента и recipes_limit подписок.
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -183,6 +237,42 @@ class ShoppingCart(models.Model):
         return f'Покупка {self.user} - {self.recipe}'
 
 
+class ShoppingCartTotal(models.Model):
+    """Сколько ингредиента нужно на все рецепты в корзине пользователя.
+
+    Поддерживается recipes.shopping_cart при изменении корзины и состава
+    рецептов в ней; строк с нулевым количеством не бывает.
+    """
+
+    user = models.ForeignKey(
+        MyUser,
+        related_name='shopping_cart_totals',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='shopping_cart_totals',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    # Со знаком: при вычитании состава рецепта строка на мгновение может
+    # уйти в минус, после чего удаляется.
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_total')]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.amount}'
+
+
 class Favorite(models.Model):
 
     user = models.ForeignKey(
@@ -206,3 +296,75 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.user} избравший {self.recipe}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика его автора.
+
+    Заполняется recipes.feed при публикации рецепта и при подписке;
+    рецептов авторов, у которых подписчиков не меньше
+    FEED_FANOUT_LIMIT, здесь нет — они читаются напрямую.
+    """
+
+    user = models.ForeignKey(
+        MyUser,
+        related_name='feed',
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        MyUser,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Автор рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        ordering = ['-recipe_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry')]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class ShortLink(models.Model):
+
+    recipe = models.OneToOneField(
+        Recipe,
+        related_name='short_link',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+    )
+    code = models.CharField(
+        max_length=MAX_SHORT_LINK_CODE_LENGTH,
+        unique=True,
+        verbose_name='Код ссылки',
+    )
+    hits = models.PositiveBigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Переходы',
+    )
+
+    class Meta:
+        verbose_name = 'Короткая ссылка'
+        verbose_name_plural = 'Короткие ссылки'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'{self.code} → {self.recipe}'
@@ -0,0 +1,152 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from .models import Ingredient, IngredientRecipe, Recipe
+from .sql import placeholders
+
+SEARCH_CONFIG = 'russian'
+# Таблица FTS5, заменяющая tsvector при работе на SQLite.
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса bm25 по столбцам FTS_TABLE: название > ингредиенты > описание.
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def fold_sql(column):
+    """Приводит ё к е: unicode61 в SQLite не считает их одной буквой."""
+    return f"REPLACE(REPLACE({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def search_vector():
+    ingredients = Subquery(
+        IngredientRecipe.objects
+        .filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Coalesce(ingredients, Value(''),
+                                output_field=TextField()),
+                       weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_index(recipe_ids=None):
+    """Перестраивает поисковый индекс рецептов recipe_ids (None — всех)."""
+    if connection.vendor == 'postgresql':
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+        recipes.update(search_vector=search_vector())
+    elif connection.vendor == 'sqlite':
+        update_fts_index(recipe_ids)
+
+
+def update_fts_index(recipe_ids):
+    fts_filter = recipe_filter = ''
+    params = []
+    if recipe_ids is not None:
+        params = list(recipe_ids)
+        if not params:
+            return
+        fts_filter = f'WHERE rowid IN ({placeholders(params)})'
+        recipe_filter = f'WHERE r.id IN ({placeholders(params)})'
+    ingredients = (
+        "SELECT group_concat(i.name, ' ') "
+        'FROM recipes_ingredientrecipe ir '
+        'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+        'WHERE ir.recipe_id = r.id'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} {fts_filter}', params)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+            f'SELECT r.id, {fold_sql("r.name")}, '
+            f"{fold_sql(f'COALESCE(({ingredients}), %s)')}, "
+            f'{fold_sql("r.text")} '
+            f'FROM recipes_recipe r {recipe_filter}',
+            ['', *params])
+
+
+def fts_query(value):
+    """Запрос FTS5: каждое слово — префикс, все слова обязательны."""
+    words = value.replace('ё', 'е').replace('Ё', 'Е').split()
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search_recipes(queryset, value):
+    """Фильтрует рецепты по запросу и сортирует по релевантности."""
+    if not value.strip():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, search_type='websearch',
+                            config=SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query))
+    elif connection.vendor == 'sqlite':
+        query = fts_query(value)
+        weights = ', '.join(map(str, FTS_WEIGHTS))
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (query,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = recipes_recipe.id',
+            (query,),
+        ))
+    else:
+        return queryset.filter(
+            Q(name__icontains=value) | Q(text__icontains=value))
+    return queryset.order_by('-search_rank', '-id')
+
+
+def schedule_update(instance, **kwargs):
+    """Индексирует рецепт после коммита, когда записаны ингредиенты."""
+    pk = instance.pk
+    transaction.on_commit(lambda: update_search_index([pk]))
+
+
+def remove_from_index(instance, **kwargs):
+    # tsvector удаляется вместе со строкой, таблицу FTS5 чистим сами.
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [instance.pk])
+
+
+def schedule_ingredient_update(instance, created, update_fields, **kwargs):
+    """Название ингредиента входит в индекс всех рецептов с ним."""
+    if created or (update_fields and 'name' not in update_fields):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: update_search_index(
+        IngredientRecipe.objects.filter(ingredient=pk)
+        .values_list('recipe_id', flat=True)))
+
+
+def schedule_ingredient_delete(instance, **kwargs):
+    # Состав удаляется каскадом, поэтому рецепты ищем до удаления.
+    recipe_ids = list(IngredientRecipe.objects.filter(
+        ingredient=instance).values_list('recipe_id', flat=True))
+    transaction.on_commit(lambda: update_search_index(recipe_ids))
+
+
+post_save.connect(schedule_update, sender=Recipe,
+                  dispatch_uid='recipe_search_update')
+post_delete.connect(remove_from_index, sender=Recipe,
+                    dispatch_uid='recipe_search_delete')
+post_save.connect(schedule_ingredient_update, sender=Ingredient,
+                  dispatch_uid='ingredient_search_update')
+pre_delete.connect(schedule_ingredient_delete, sender=Ingredient,
+                   dispatch_uid='ingredient_search_delete')
@@ -0,0 +1,108 @@
+"""Итоги корзины: суммарное количество каждого ингредиента по всем
+рецептам в корзине пользователя.
+
+Итоги меняются приращениями одной командой INSERT … ON CONFLICT DO
+UPDATE: при добавлении рецепта в корзину его состав прибавляется,
+при удалении — вычитается, при правке состава рецепта разница
+прибавляется всем, у кого он в корзине. Строки, дошедшие до нуля,
+удаляются. rebuild() сверяет итоги с корзинами целиком.
+"""
+from django.db import connection
+from django.db.models.signals import post_save, pre_delete
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingCartTotal
+from .sql import insert_select, placeholders, table
+
+
+def upsert(select):
+    """INSERT итогов из select (user_id, ingredient_id, amount) с
+    прибавлением к существующим строкам."""
+    return insert_select(
+        ShoppingCartTotal, ('user', 'ingredient', 'amount'), select,
+        '(user_id, ingredient_id) DO UPDATE '
+        f'SET amount = {table(ShoppingCartTotal)}.amount + excluded.amount')
+
+
+def change_totals(user_id, recipe_ids, sign):
+    """Прибавляет (sign=1) или вычитает (sign=-1) состав рецептов
+    recipe_ids к итогам корзины user_id."""
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(upsert(
+            f'SELECT %s, ingredient_id, %s * SUM(amount) '
+            f'FROM {table(IngredientRecipe)} '
+            f'WHERE recipe_id IN ({placeholders(recipe_ids)}) '
+            f'GROUP BY ingredient_id'), [user_id, sign, *recipe_ids])
+        if sign < 0:
+            cursor.execute(
+                f'DELETE FROM {table(ShoppingCartTotal)} '
+                f'WHERE user_id = %s AND amount <= 0', [user_id])
+
+
+def change_recipe_totals(recipe_id, deltas):
+    """Прибавляет изменения состава {id ингредиента: разница} рецепта
+    recipe_id к итогам всех, у кого он в корзине."""
+    if not deltas:
+        return
+    rows = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS amount'] * len(deltas))
+    with connection.cursor() as cursor:
+        cursor.execute(upsert(
+            f'SELECT c.user_id, d.ingredient_id, d.amount '
+            f'FROM {table(ShoppingCart)} c, ({rows}) d '
+            f'WHERE c.recipe_id = %s'),
+            [*(value for item in deltas.items() for value in item),
+             recipe_id])
+        decreased = [pk for pk, delta in deltas.items() if delta < 0]
+        if decreased:
+            cursor.execute(
+                f'DELETE FROM {table(ShoppingCartTotal)} WHERE amount <= 0 '
+                f'AND ingredient_id IN ({placeholders(decreased)}) '
+                f'AND user_id IN (SELECT user_id FROM {table(ShoppingCart)} '
+                f'WHERE recipe_id = %s)', [*decreased, recipe_id])
+
+
+def rebuild():
+    """Сверяет итоги с корзинами, исправляя только разошедшиеся строки.
+
+    Возвращает (удалено строк, добавлено строк); строка с неверным
+    количеством учитывается в обоих числах.
+    """
+    actual = (
+        f'SELECT c.user_id, i.ingredient_id, SUM(i.amount) AS amount '
+        f'FROM {table(ShoppingCart)} c JOIN {table(IngredientRecipe)} i '
+        f'ON i.recipe_id = c.recipe_id '
+        f'GROUP BY c.user_id, i.ingredient_id')
+    totals = table(ShoppingCartTotal)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {totals} WHERE id IN ('
+            f'SELECT t.id FROM {totals} t LEFT JOIN ({actual}) a '
+            f'ON a.user_id = t.user_id AND a.ingredient_id = t.ingredient_id '
+            f'WHERE a.amount IS NULL OR a.amount <> t.amount)')
+        removed = cursor.rowcount
+        cursor.execute(
+            f'INSERT INTO {totals} (user_id, ingredient_id, amount) '
+            f'SELECT a.user_id, a.ingredient_id, a.amount FROM ({actual}) a '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {totals} t '
+            f'WHERE t.user_id = a.user_id '
+            f'AND t.ingredient_id = a.ingredient_id)')
+        return removed, cursor.rowcount
+
+
+def add_to_totals(instance, created, raw, **kwargs):
+    if created and not raw:
+        change_totals(instance.user_id, [instance.recipe_id], 1)
+
+
+def remove_from_totals(instance, **kwargs):
+    # pre_delete, а не post_delete: при удалении рецепта каскадом его
+    # состав может исчезнуть раньше строки корзины.
+    change_totals(instance.user_id, [instance.recipe_id], -1)
+
+
+post_save.connect(add_to_totals, sender=ShoppingCart,
+                  dispatch_uid='shopping_cart_totals_add')
+pre_delete.connect(remove_from_totals, sender=ShoppingCart,
+                   dispatch_uid='shopping_cart_totals_remove')
@@ -0,0 +1,30 @@
+"""Сырой SQL пакетных записей: имена таблиц и столбцов, списки
+параметров и INSERT … SELECT … ON CONFLICT."""
+from django.db import connection
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def column(model, field):
+    return connection.ops.quote_name(model._meta.get_field(field).column)
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def insert_select(model, fields, select, on_conflict='DO NOTHING',
+                  returning=None):
+    """INSERT в столбцы полей fields модели model из select.
+
+    WHERE в select обязателен: без него SQLite принимает ON CONFLICT
+    за часть соединения таблиц.
+    """
+    columns = ', '.join(column(model, field) for field in fields)
+    sql = (f'INSERT INTO {table(model)} ({columns}) {select} '
+           f'ON CONFLICT {on_conflict}')
+    if returning is not None:
+        sql += f' RETURNING {column(model, returning)}'
+    return sql
@@ -0,0 +1,129 @@
+import base64
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from recipes import feed
+from recipes.models import FeedEntry, Recipe
+from users.models import MyUser, Subscription
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    'GA60e6kgAAAABJRU5ErkJggg==')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_RENDITION_WORKERS=0,
+                   FEED_FANOUT_LIMIT=2)
+class FeedTest(TestCase):
+    """Лента после каждой операции совпадает с прямым запросом.
+
+    Порог FEED_FANOUT_LIMIT = 2: автор со вторым подписчиком становится
+    популярным, и его рецепты перестают раскладываться по лентам.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.other_author, cls.first, cls.second = (
+            MyUser.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='Pa55-word')
+            for name in ('author', 'other_author', 'first', 'second'))
+
+    def publish(self, author, count=1):
+        for _ in range(count):
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {Recipe.objects.count()}',
+                text='Описание', cooking_time=30,
+                image=ContentFile(PNG, 'image.png'))
+
+    def subscribe(self, user, author):
+        Subscription.objects.create(subscriber=user, subscribed_to=author)
+
+    def assertFeeds(self):
+        for user in (self.first, self.second):
+            expected = list(
+                Recipe.objects.filter(author__subscribers__subscriber=user)
+                .order_by('-id').values_list('pk', flat=True))
+            with self.subTest(user=user.username):
+                self.assertEqual(feed.recipe_ids(user), expected)
+                self.assertEqual(feed.recipe_ids(user, limit=2),
+                                 expected[:2])
+                if expected:
+                    before = expected[len(expected) // 2]
+                    self.assertEqual(
+                        feed.recipe_ids(user, before=before, limit=2),
+                        [pk for pk in expected if pk < before][:2])
+
+    def test_publish_and_subscribe(self):
+        self.publish(self.author, 2)
+        self.subscribe(self.first, self.author)
+        self.assertFeeds()
+        self.publish(self.author)
+        self.publish(self.other_author)
+        self.assertFeeds()
+        self.assertEqual(FeedEntry.objects.filter(user=self.first).count(),
+                         3)
+
+    def test_limit_crossed_up_and_down(self):
+        self.subscribe(self.first, self.author)
+        self.subscribe(self.first, self.other_author)
+        self.publish(self.author, 2)
+        self.publish(self.other_author)
+        self.subscribe(self.second, self.author)
+        self.assertFeeds()
+        # Автор популярен: новые рецепты читаются при запросе ленты.
+        self.publish(self.author, 2)
+        self.publish(self.other_author)
+        self.assertFeeds()
+        self.assertEqual(
+            FeedEntry.objects.filter(author=self.author).count(), 2)
+        Subscription.objects.get(
+            subscriber=self.second, subscribed_to=self.author).delete()
+        # Снова ниже порога: вышедшие за это время рецепты разложены.
+        self.assertEqual(
+            FeedEntry.objects.filter(author=self.author).count(), 4)
+        self.assertFeeds()
+        self.publish(self.author)
+        self.assertFeeds()
+
+    def test_unsubscribe_and_delete(self):
+        self.subscribe(self.first, self.author)
+        self.subscribe(self.first, self.other_author)
+        self.publish(self.author, 2)
+        self.publish(self.other_author, 2)
+        Recipe.objects.filter(author=self.other_author).first().delete()
+        self.assertFeeds()
+        Subscription.objects.get(
+            subscriber=self.first, subscribed_to=self.author).delete()
+        self.assertFeeds()
+        self.assertFalse(
+            FeedEntry.objects.filter(author=self.author).exists())
+        self.other_author.delete()
+        self.assertFeeds()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_rebuild(self):
+        self.subscribe(self.first, self.author)
+        self.subscribe(self.first, self.other_author)
+        self.publish(self.author, 2)
+        self.publish(self.other_author, 2)
+        self.assertEqual(feed.rebuild(), (0, 0))
+        FeedEntry.objects.filter(author=self.author).delete()
+        FeedEntry.objects.create(
+            user=self.second, recipe=Recipe.objects.first(),
+            author=self.author)
+        self.assertEqual(feed.rebuild(), (1, 2))
+        self.assertFeeds()
+        # Записи популярного автора rebuild() удаляет, лента не меняется.
+        self.subscribe(self.second, self.author)
+        self.assertEqual(feed.rebuild(), (2, 0))
+        self.assertFeeds()
+        self.assertEqual(feed.rebuild(), (0, 0))
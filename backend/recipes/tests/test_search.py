@@ -0,0 +1,114 @@
+import base64
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.search import FTS_TABLE
+from users.models import MyUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    'GA60e6kgAAAABJRU5ErkJggg==')
+
+
+@skipUnless(connection.vendor == 'sqlite',
+            'FTS5 используется только на SQLite')
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_RENDITION_WORKERS=0)
+class SqliteSearchTest(APITestCase):
+    """Фильтр search на FTS5: релевантность и обновление индекса."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = MyUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов', password='Pa55-word')
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.potato = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г')
+        cls.water = Ingredient.objects.create(
+            name='Вода', measurement_unit='мл')
+
+    def create_recipe(self, name, text, ingredients):
+        # Индекс пересобирается после коммита, когда состав уже записан.
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name=name, text=text,
+                cooking_time=30, image=ContentFile(PNG, 'image.png'))
+            recipe.tags.add(self.tag)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=100)
+                for ingredient in ingredients)
+        return recipe
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_ranking(self):
+        in_text = self.create_recipe(
+            'Суп', 'Нарезать картофель кубиками.', [self.water])
+        in_ingredients = self.create_recipe(
+            'Гарнир', 'Отварить до готовности.', [self.potato, self.water])
+        in_name = self.create_recipe(
+            'Картофель по-деревенски', 'Запечь дольками.', [self.water])
+        self.assertEqual(self.search('картофель'),
+                         [in_name.pk, in_ingredients.pk, in_text.pk])
+
+    def test_prefix_and_yo(self):
+        recipe = self.create_recipe(
+            'Ёжики из фарша', 'Слепить и потушить.', [self.water])
+        self.assertEqual(self.search('ежик'), [recipe.pk])
+        self.assertEqual(self.search('ёжики фарш'), [recipe.pk])
+        self.assertEqual(self.search('ежики борщ'), [])
+
+    def test_index_follows_save(self):
+        recipe = self.create_recipe(
+            'Борщ', 'Сварить бульон.', [self.water])
+        self.assertEqual(self.search('борщ'), [recipe.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Щи'
+            recipe.save()
+        self.assertEqual(self.search('борщ'), [])
+        self.assertEqual(self.search('щи'), [recipe.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.potato, amount=200)
+            recipe.save()
+        self.assertEqual(self.search('картофель'), [recipe.pk])
+
+    def test_index_follows_ingredient(self):
+        recipe = self.create_recipe(
+            'Гарнир', 'Отварить до готовности.', [self.potato, self.water])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.potato.name = 'Батат'
+            self.potato.save()
+        self.assertEqual(self.search('картофель'), [])
+        self.assertEqual(self.search('батат'), [recipe.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.potato.delete()
+        self.assertEqual(self.search('батат'), [])
+        self.assertEqual(self.search('вода'), [recipe.pk])
+
+    def test_index_follows_delete(self):
+        recipe = self.create_recipe(
+            'Борщ', 'Сварить бульон.', [self.water])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertEqual(self.search('борщ'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 0)
@@ -0,0 +1,149 @@
+import base64
+import shutil
+import tempfile
+from collections import defaultdict
+
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api.recipe_lists import add_recipes, remove_recipes
+from recipes import shopping_cart
+from recipes.models import (Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from users.models import MyUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    'GA60e6kgAAAABJRU5ErkJggg==')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_RENDITION_WORKERS=0)
+class ShoppingCartTotalTest(APITestCase):
+    """Итоги корзины после каждой операции совпадают с пересчётом."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.user, cls.other = (
+            MyUser.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='Pa55-word')
+            for name in ('author', 'user', 'other'))
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.flour, cls.milk, cls.egg = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Молоко', 'Яйцо'))
+        cls.pancakes = cls.create_recipe(
+            'Блины', {cls.flour: 200, cls.milk: 500, cls.egg: 2})
+        cls.bread = cls.create_recipe('Хлеб', {cls.flour: 500})
+
+    @classmethod
+    def create_recipe(cls, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=name, text='Описание',
+            cooking_time=30, image=ContentFile(PNG, 'image.png'))
+        recipe.tags.add(cls.tag)
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in ingredients.items())
+        return recipe
+
+    def assertTotals(self, expected=None):
+        """Итоги равны составу корзин и rebuild() нечего исправлять."""
+        totals = {
+            (row.user_id, row.ingredient_id): row.amount
+            for row in ShoppingCartTotal.objects.all()}
+        actual = defaultdict(int)
+        for item in ShoppingCart.objects.all():
+            for row in IngredientRecipe.objects.filter(
+                    recipe=item.recipe_id):
+                actual[item.user_id, row.ingredient_id] += row.amount
+        self.assertEqual(totals, dict(actual))
+        if expected is not None:
+            self.assertEqual(totals, expected)
+        self.assertEqual(shopping_cart.rebuild(), (0, 0))
+
+    def test_add_and_remove(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.pancakes)
+        self.assertTotals({
+            (self.user.pk, self.flour.pk): 200,
+            (self.user.pk, self.milk.pk): 500,
+            (self.user.pk, self.egg.pk): 2,
+        })
+        ShoppingCart.objects.create(user=self.user, recipe=self.bread)
+        self.assertTotals()
+        self.assertEqual(ShoppingCartTotal.objects.get(
+            user=self.user, ingredient=self.flour).amount, 700)
+        ShoppingCart.objects.get(user=self.user, recipe=self.pancakes).delete()
+        self.assertTotals({(self.user.pk, self.flour.pk): 500})
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assertTotals({})
+
+    def test_batch(self):
+        recipes = [self.pancakes.pk, self.bread.pk]
+        self.assertEqual(add_recipes(ShoppingCart, self.user, recipes),
+                         sorted(recipes))
+        self.assertEqual(add_recipes(ShoppingCart, self.user, recipes), [])
+        self.assertTotals()
+        remove_recipes(ShoppingCart, self.user, [self.bread.pk])
+        self.assertTotals()
+        remove_recipes(ShoppingCart, self.user, recipes)
+        self.assertTotals({})
+
+    def test_recipe_update(self):
+        for user in (self.user, self.other):
+            ShoppingCart.objects.create(user=user, recipe=self.pancakes)
+        ShoppingCart.objects.create(user=self.user, recipe=self.bread)
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.pancakes.pk}/', {
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': self.flour.pk, 'amount': 250},
+                                {'id': self.egg.pk, 'amount': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotals()
+        self.assertFalse(ShoppingCartTotal.objects.filter(
+            ingredient=self.milk).exists())
+        response = self.client.patch(
+            f'/api/recipes/{self.pancakes.pk}/', {
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': self.milk.pk, 'amount': 300}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotals()
+
+    def test_recipe_deleted(self):
+        for user in (self.user, self.other):
+            ShoppingCart.objects.create(user=user, recipe=self.pancakes)
+            ShoppingCart.objects.create(user=user, recipe=self.bread)
+        self.pancakes.delete()
+        self.assertTotals({
+            (self.user.pk, self.flour.pk): 500,
+            (self.other.pk, self.flour.pk): 500,
+        })
+
+    def test_user_deleted(self):
+        for user in (self.user, self.other):
+            ShoppingCart.objects.create(user=user, recipe=self.pancakes)
+        self.user.delete()
+        self.assertTotals()
+        self.author.delete()
+        self.assertTotals({})
+
+    def test_rebuild_repairs(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.pancakes)
+        ShoppingCartTotal.objects.filter(ingredient=self.flour).update(
+            amount=1)
+        ShoppingCartTotal.objects.filter(ingredient=self.egg).delete()
+        ShoppingCartTotal.objects.create(
+            user=self.other, ingredient=self.milk, amount=10)
+        self.assertEqual(shopping_cart.rebuild(), (2, 2))
+        self.assertTotals()
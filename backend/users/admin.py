@@ -10,7 +10,9 @@ class UserAdmin(admin.ModelAdmin):
         'email',
         'username',
         'first_name',
-        'last_name'
+        'last_name',
+        'recipes_count',
+        'subscribers_count'
     )
     search_fields = ('email', 'username')
 
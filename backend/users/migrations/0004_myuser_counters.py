@@ -0,0 +1,47 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('users.MyUser', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.MyUser', 'subscribers_count', 'users.Subscription',
+     'subscribed_to'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, fk_name in COUNTERS:
+        related_model = apps.get_model(related_name)
+        apps.get_model(model_name).objects.update(**{
+            field: Coalesce(Subquery(
+                related_model.objects
+                .filter(**{fk_name: OuterRef('pk')})
+                .order_by()
+                .values(fk_name)
+                .annotate(total=Count('pk'))
+                .values('total')
+            ), Value(0))
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_rename_user_myuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]